@@ -1,30 +1,31 @@
+from concurrent.futures import ProcessPoolExecutor
+from signed_graph.shared_graph import attach_signed_graph
 from algorithms.subroutines.commons import *
 from utilities.time_measure import ExecutionTime
 from utilities.print_console import print_end_algorithm
 
+# graph of the worker processes (it keeps the shared memory blocks of its arrays mapped)
+worker_signed_graph = None
 
-def bansal(signed_graph, print_results=True):
+
+def bansal(signed_graph, print_results=True, workers=1, block_size=4096):
     # start of the algorithm
     execution_time = ExecutionTime()
 
-    # initialize the solution as empty
-    solution_x = None
-    solution_objective_function = np.finfo(float).min
+    # The candidate of node v is x = 1 on v and its positive neighbors, -1 on its negative neighbors. Its numerator
+    # x^T A x is 2 deg(v) for the edges of v, plus the signs of the triangles through v (A^3)_vv for the edges among
+    # the neighbors, and its denominator is deg(v) + 1: every candidate is evaluated from its neighborhood only
+    degree = signed_graph.get_degrees()
+    triangles = neighborhood_triangles(signed_graph, workers, block_size)
+    objective_functions = (2 * degree + triangles) / (degree + 1)
 
     # get the best clustering from the neighborhood of each node
-    for node, neighbors in enumerate(signed_graph.adjacency_list):
-        x = np.zeros(signed_graph.number_of_nodes)
-        x[node] = 1
-        for neighbor in neighbors[0]:
-            x[neighbor] = 1
-        for neighbor in neighbors[1]:
-            x[neighbor] = -1
-
-        # update the solution if needed
-        objective_function = evaluate_objective_function(signed_graph, x)
-        if objective_function > solution_objective_function:
-            solution_x = x
-            solution_objective_function = objective_function
+    node = int(np.argmax(objective_functions))
+    solution_objective_function = objective_functions[node]
+    solution_x = np.zeros(signed_graph.number_of_nodes)
+    start, end = signed_graph.indptr[node], signed_graph.indptr[node + 1]
+    solution_x[signed_graph.indices[start:end]] = np.sign(signed_graph.data[start:end])
+    solution_x[node] = 1
 
     # build the solution
     solution = build_solution(solution_x)
@@ -38,3 +39,33 @@ def bansal(signed_graph, print_results=True):
 
     # return the solution
     return solution, solution_x
+
+
+def neighborhood_triangles(signed_graph, workers=1, block_size=4096):
+    # (A^3)_vv = sum_u ((A A) * A)_vu for every node, computed on blocks of rows (so that A A is never built whole),
+    # spread over a process pool when more than one worker is requested
+    n = signed_graph.number_of_nodes
+    blocks = [(start, min(start + block_size, n)) for start in range(0, n, block_size)]
+
+    if workers <= 1 or len(blocks) <= 1:
+        a = signed_graph.get_adjacency_matrix()
+        return np.concatenate([block_triangles(a, start, end) for start, end in blocks] or [np.zeros(0)])
+
+    with signed_graph.share() as shared_graph:
+        with ProcessPoolExecutor(max_workers=workers, initializer=initialize_worker, initargs=(shared_graph.descriptor,)) as executor:
+            return np.concatenate(list(executor.map(worker_block_triangles, blocks)))
+
+
+def block_triangles(a, start, end):
+    rows = a[start:end]
+    return np.asarray(rows.dot(a).multiply(rows).sum(axis=1)).ravel()
+
+
+def initialize_worker(descriptor):
+    # the workers multiply over the arrays of the graph in shared memory
+    global worker_signed_graph
+    worker_signed_graph = attach_signed_graph(descriptor)
+
+
+def worker_block_triangles(block):
+    return block_triangles(worker_signed_graph.get_adjacency_matrix(), *block)
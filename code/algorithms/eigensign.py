@@ -1,39 +1,25 @@
 from algorithms.subroutines.commons import *
 from utilities.time_measure import ExecutionTime
 from utilities.print_console import print_end_algorithm
-from scipy.sparse.linalg import eigs, eigsh
 
 
-def eigensign(signed_graph, print_results=True):
+def eigensign(signed_graph, print_results=True, return_threshold=False):
     # start of the algorithm
     execution_time = ExecutionTime()
 
-    # initialize the solution as empty
-    solution_x = None
-    solution_objective_function = np.finfo(float).min
-    solution_threshold = None
-
-    # obtain the adjacency matrix
-    a = signed_graph.get_adjacency_matrix()
-
     # get the eigenvector corresponding to the maximum eigenvalue
-    maximum_eigenvector = np.squeeze(eigsh(a, k=1, which='LA')[1])
+    maximum_eigenvector = get_maximum_eigenvector(signed_graph)
 
     #print("All in range? ", np.all((maximum_eigenvector >= -1) & (maximum_eigenvector <= 1)))
 
-    # get the thresholds from the eigenvector
-    thresholds = {int(np.abs(element) * 1000) / 1000.0 for element in maximum_eigenvector}
-
-    # compute x for all the values of the threshold
-    for threshold in thresholds:
-        x = np.array([np.sign(element) if np.abs(element) >= threshold else 0 for element in maximum_eigenvector])
+    # evaluate x for all the distinct values of the threshold in one sweep
+    thresholds, objective_functions = sweep_thresholds(signed_graph, maximum_eigenvector)
 
-        # update the solution if needed
-        objective_function = evaluate_objective_function(signed_graph, x)
-        if objective_function > solution_objective_function:
-            solution_x = x
-            solution_objective_function = objective_function
-            solution_threshold = threshold
+    # pick the best threshold (the largest one, among ties)
+    best = np.argmax(np.nan_to_num(objective_functions, nan=-np.inf))
+    solution_threshold = thresholds[best]
+    solution_objective_function = objective_functions[best]
+    solution_x = np.where(np.abs(maximum_eigenvector) >= solution_threshold, np.sign(maximum_eigenvector), 0)
 
     # build the solution
     solution = build_solution(solution_x)
@@ -46,6 +32,9 @@ def eigensign(signed_graph, print_results=True):
         print_end_algorithm(execution_time.execution_time_seconds, [solution_x], signed_graph, [solution_objective_function], thresholds=[solution_threshold])
 
     # return the solution
+    if return_threshold:
+        return solution, solution_x, solution_threshold
+
     return solution, solution_x
 
 
@@ -53,12 +42,8 @@ def eigensign_binary(signed_graph, print_results=False):
     # start of the algorithm
     execution_time = ExecutionTime()
 
-    # obtain the adjacency matrix
-    a = signed_graph.get_adjacency_matrix()
-
-    
     # get the eigenvector corresponding to the maximum eigenvalue
-    maximum_eigenvector = np.squeeze(eigsh(a, k=1, which='LA')[1]) # OLD
+    maximum_eigenvector = get_maximum_eigenvector(signed_graph)
     #_, maximum_eigenvector = eigs(a, k=1, which='LR')
     #print(maximum_eigenvector)
 
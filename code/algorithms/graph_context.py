@@ -0,0 +1,51 @@
+from algorithms.subroutines.commons import *
+from algorithms.eigensign import eigensign_binary
+from utilities.time_measure import ExecutionTime
+
+
+class GraphContext:
+    # quantities shared by the algorithms run on one graph, each computed once on first use
+    # (the adjacency matrices and the leading eigenpair are cached by the graph itself)
+
+    def __init__(self, signed_graph):
+        self.signed_graph = signed_graph
+        self.degrees = None
+        self.eigensign_binary_solution = None
+        self.eigensign_degrees = None
+
+        # seconds spent by precompute
+        self.precomputation_time = 0
+
+    def precompute(self):
+        # compute everything up front, so that the running times of the algorithms do not include it
+        execution_time = ExecutionTime()
+        self.signed_graph.get_adjacency_matrix()
+        self.signed_graph.get_unsigned_adjacency_matrix()
+        get_maximum_eigenpair(self.signed_graph)
+        self.get_degrees()
+        self.get_eigensign_degrees()
+        execution_time.end_algorithm()
+        self.precomputation_time = execution_time.execution_time_seconds
+
+    def get_degrees(self):
+        if self.degrees is None:
+            self.degrees = self.signed_graph.get_degrees()
+
+        return self.degrees
+
+    def get_eigensign_binary_solution(self):
+        # signs of the maximum eigenvector (the starting solution of the greedy2PC variants); read-only, as it is shared
+        if self.eigensign_binary_solution is None:
+            _, self.eigensign_binary_solution, _ = eigensign_binary(self.signed_graph, print_results=False)
+            self.eigensign_binary_solution.flags.writeable = False
+
+        return self.eigensign_binary_solution
+
+    def get_eigensign_degrees(self):
+        # eigensign degree and inconsistent degree of every node w.r.t. the eigensign binary solution
+        if self.eigensign_degrees is None:
+            self.eigensign_degrees = compute_eigensign_degrees(self.signed_graph, self.get_eigensign_binary_solution())
+            for degrees in self.eigensign_degrees:
+                degrees.flags.writeable = False
+
+        return self.eigensign_degrees
@@ -1,108 +1,140 @@
-from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
 from algorithms.subroutines.commons import *
-from algorithms.eigensign import eigensign_binary
+from algorithms.subroutines.eigensolvers import get_default_eigensolver, set_default_eigensolver
+from signed_graph.shared_graph import attach_signed_graph
+from algorithms.subroutines.bucket_queue import BucketQueue
 from utilities.time_measure import ExecutionTime
 from utilities.print_console import print_end_algorithm
 
-def greedy2PC(signed_graph, eigensign_solution, print_results=True):
+def greedy2PC(signed_graph, eigensign_solution, print_results=True, return_trace=False, eigensign_degrees=None):
     execution_time = ExecutionTime()
     
     # Initialize solution with all nodes
-    nodes = set(i for i, value in enumerate(eigensign_solution) if value != 0)
+    nodes = np.flatnonzero(eigensign_solution)
     #solution_objective_function = evaluate_objective_function(signed_graph, eigensign_solution)
     
-    # Compute the eigensign degree of each node
-    degree = {}
-    inconsistent_degree = {}
-    degree_lists = defaultdict(set)
+    # Compute the eigensign degree of each node with one signed SpMV: diag(x) A x (unless they are given)
+    if eigensign_degrees is None:
+        eigensign_degrees = compute_eigensign_degrees(signed_graph, eigensign_solution)
+    degree, inconsistent_degree = eigensign_degrees[0], eigensign_degrees[1].copy()
+    consistent_degree = degree + inconsistent_degree
     max_inconsistent_degree = 0
-    total_degree = 0.0
-
-    for node in nodes:
-        consistent_degree = 0
-        inconsistent_degree[node] = 0
-        for neighbor_type in [0, 1]:
-            for neighbor in signed_graph.adjacency_list[node][neighbor_type]:
-                if neighbor in nodes:
-                    if eigensign_solution[node] == eigensign_solution[neighbor]:
-                        if neighbor_type == 0:  # positive edge
-                            consistent_degree += 1
-                        else:  # negative edge
-                            inconsistent_degree[node] += 1
-                    else:
-                        if neighbor_type == 0:  # positive edge
-                            inconsistent_degree[node] += 1
-                        else:  # negative edge
-                            consistent_degree += 1
-        
-        degree[node] = consistent_degree - inconsistent_degree[node]
-        degree_lists[degree[node]].add(node)
-        total_degree += degree[node]
+    total_degree = float(degree[nodes].sum())
+
+    # Bucket queue over the eigensign degrees (a degree only moves within [-inconsistent, consistent])
+    queue = BucketQueue(signed_graph.number_of_nodes, -inconsistent_degree.max(initial=0), consistent_degree.max(initial=0))
+    queue.insert_all(nodes, degree[nodes])
+    signs = memoryview(np.sign(eigensign_solution).astype(np.int64))
+    inconsistent_degree = memoryview(inconsistent_degree)
+    indptr, indices, data = signed_graph.indptr, signed_graph.indices, signed_graph.data
     
     # Pick a lowest eigensign degree node
-    x = eigensign_solution.copy()
-    current_density = total_degree / len(nodes)
+    remaining_nodes = len(nodes)
+    current_density = total_degree / remaining_nodes
 
     #assert current_density == solution_objective_function
 
+    # Log the removals; the best solution is rebuilt from the log at the end
+    removal_order = []
+    densities = [current_density]
     best_density = current_density
-    best_solution = nodes.copy()
-    best_solution_x = x.copy()
+    best_step = 0
 
-    min_degree = min(degree_lists.keys())
-    while nodes:
-        while not degree_lists[min_degree]:
-            min_degree += 1
-
-        node = degree_lists[min_degree].pop()
-        nodes.remove(node)
+    while queue:
+        node, node_degree = queue.pop_min()
+        remaining_nodes -= 1
 
         # Update the solution
-        x[node] = 0
-        total_degree -= (2 * degree[node])
-        current_density = total_degree / len(nodes) if nodes else 0
+        removal_order.append(node)
+        total_degree -= (2 * node_degree)
+        current_density = total_degree / remaining_nodes if remaining_nodes else 0
+        densities.append(current_density)
 
         # Update max_inconsistent_degree
         max_inconsistent_degree = max(max_inconsistent_degree, inconsistent_degree[node])
 
-        # Update the eigensign degree of its neighbors
-        for neighbor_type in [0, 1]:
-            for neighbor in signed_graph.adjacency_list[node][neighbor_type]:
-                if neighbor in nodes:
-                    old_degree = degree[neighbor]
-                    degree_lists[old_degree].remove(neighbor)
-
-                    if eigensign_solution[node] == eigensign_solution[neighbor]:
-                        if neighbor_type == 0:  # positive edge
-                            degree[neighbor] -= 1
-                        else:  # negative edge
-                            degree[neighbor] += 1
-                            inconsistent_degree[neighbor] -= 1
-                    else:
-                        if neighbor_type == 0:  # positive edge
-                            degree[neighbor] += 1
-                            inconsistent_degree[neighbor] -= 1
-                        else:  # negative edge
-                            degree[neighbor] -= 1
-
-                    degree_lists[degree[neighbor]].add(neighbor)
-                    min_degree = min(min_degree, degree[neighbor])
-
+        # Update the eigensign degree of its neighbors (+1 for a consistent edge, -1 for an inconsistent one)
+        node_sign = signs[node]
+        start, end = indptr[node], indptr[node + 1]
+        for neighbor, edge_sign in zip(indices[start:end].tolist(), data[start:end].astype(np.int64).tolist()):
+            if neighbor in queue:
+                consistency = edge_sign * node_sign * signs[neighbor]
+                queue.update(neighbor, queue.get_key(neighbor) - consistency)
+                if consistency < 0:
+                    inconsistent_degree[neighbor] -= 1
 
         if current_density > best_density:
             best_density = current_density
-            best_solution = nodes.copy()
-            best_solution_x = x.copy()
+            best_step = len(removal_order)
+
+    best_solution_x, best_solution = rebuild_peeled_solution(eigensign_solution, removal_order, best_step)
 
     execution_time.end_algorithm()
 
     if print_results:
         print_end_algorithm(execution_time.execution_time_seconds, [best_solution_x], signed_graph, [best_density])
 
+    if return_trace:
+        return best_solution, best_solution_x, max_inconsistent_degree, build_peeling_trace(removal_order, densities)
+
     return best_solution, best_solution_x, max_inconsistent_degree
 
 
-def greedy2PC_plus_plus(signed_graph, eigensign_solution, T, print_results=True, use_convergence=False, convergence_threshold=0.001):
+def greedy2PC_batch(signed_graph, eigensign_solution, epsilon=0.1, print_results=True, return_trace=False, eigensign_degrees=None):
+    execution_time = ExecutionTime()
+
+    # Initialize solution with all nodes
+    signs = np.sign(eigensign_solution).astype('d')
+    active = signs != 0
+    removal_round = np.full(signed_graph.number_of_nodes, -1, dtype=np.int64)
+
+    max_inconsistent_degree = 0
+    best_density = float('-inf')
+    best_round = 0
+    densities = []
+
+    # Remove in each round all the nodes whose eigensign degree is at most (1 + epsilon) times the average eigensign degree
+    rounds = 0
+    while active.any():
+        if rounds == 0 and eigensign_degrees is not None:
+            degree, inconsistent_degree = eigensign_degrees
+        else:
+            degree, inconsistent_degree = compute_eigensign_degrees(signed_graph, signs * active)
+        current_density = degree[active].sum() / np.count_nonzero(active)
+        densities.append(current_density)
+        if current_density > best_density:
+            best_density = current_density
+            best_round = rounds
+
+        # the threshold is never below the average, so at least one node is removed per round
+        threshold = current_density + epsilon * abs(current_density)
+        removed = active & (degree <= threshold)
+        max_inconsistent_degree = max(max_inconsistent_degree, int(inconsistent_degree[removed].max()))
+
+        removal_round[removed] = rounds
+        active &= ~removed
+        rounds += 1
+
+    # Rebuild the best solution: the nodes still active at the start of the best round
+    best_solution_x = eigensign_solution.copy()
+    best_solution_x[(removal_round >= 0) & (removal_round < best_round)] = 0
+    best_solution = set(np.flatnonzero(best_solution_x).tolist())
+
+    # No approximation factor is reported: with inconsistent edges, neither this nor one-node-at-a-time peeling is
+    # within a constant factor of the optimum (see the maximum inconsistent degree instead)
+
+    execution_time.end_algorithm()
+
+    if print_results:
+        print_end_algorithm(execution_time.execution_time_seconds, [best_solution_x], signed_graph, [best_density])
+
+    if return_trace:
+        return best_solution, best_solution_x, max_inconsistent_degree, rounds, {"removal_round": removal_round, "density": np.asarray(densities, dtype='d')}
+
+    return best_solution, best_solution_x, max_inconsistent_degree, rounds
+
+
+def greedy2PC_plus_plus(signed_graph, eigensign_solution, T, print_results=True, use_convergence=False, convergence_threshold=0.001, gap=None, debug=False, return_trace=False, eigensign_degrees=None):
     execution_time = ExecutionTime()
 
     best_solution = None
@@ -112,90 +144,99 @@ def greedy2PC_plus_plus(signed_graph, eigensign_solution, T, print_results=True,
     previous_objective = None
 
     # Initialize l_v for each node
-    l_v = {node: 0 for node in signed_graph.nodes_iterator}
+    l_v = np.zeros(signed_graph.number_of_nodes, dtype=np.int64)
+
+    # Consistent edges assigned to each node over all iterations (edges are assigned to the endpoint removed first):
+    # 2 * max_v positive_load[v] / iterations bounds the polarity of every S signed as the start (the sign pattern
+    # bound), not the polarity of other sign patterns
+    positive_load = np.zeros(signed_graph.number_of_nodes, dtype=np.int64)
+
+    # The maximum eigenvalue bounds the polarity of any vector from above (certified upper bound of the 2PC optimum)
+    maximum_eigenvalue, _ = get_maximum_eigenpair(signed_graph)
+    upper_bound = maximum_eigenvalue
+    sign_pattern_bound = maximum_eigenvalue
+
+    # Removal order and densities of each iteration
+    traces = []
+
+    # The eigensign degrees of the full graph do not change across iterations
+    if eigensign_degrees is None:
+        eigensign_degrees = compute_eigensign_degrees(signed_graph, eigensign_solution)
+    eigensign_degree, eigensign_inconsistent_degree = eigensign_degrees
+    eigensign_consistent_degree = eigensign_degree + eigensign_inconsistent_degree
+    signs = memoryview(np.sign(eigensign_solution).astype(np.int64))
+    indptr, indices, data = signed_graph.indptr, signed_graph.indices, signed_graph.data
 
     iteration = 0
     while True:
-        # Initialize solution with all nodes
-        solution = set(signed_graph.nodes_iterator)
-        solution_x = build_x(signed_graph, solution)
-        solution_objective_function = evaluate_objective_function(signed_graph, solution_x)
+        # Initialize solution with all nodes, signed as the start
+        solution_x = np.sign(eigensign_solution).astype('d')
+        numerator, denominator = evaluate_objective_function_terms(signed_graph, solution_x)
+        solution_objective_function = objective_function_from_terms(numerator, denominator)
 
         # Compute the eigensign degree of each node
-        degree = {}
-        inconsistent_degree = {}
-        degree_sets = defaultdict(set)
+        degree = eigensign_degree + l_v
+        inconsistent_degree = memoryview(eigensign_inconsistent_degree.copy())
         max_inconsistent_degree = 0
 
-        for node in signed_graph.nodes_iterator:
-            consistent_degree = 0
-            inconsistent_degree[node] = 0
-            for neighbor_type in [0, 1]:
-                for neighbor in signed_graph.adjacency_list[node][neighbor_type]:
-                    if eigensign_solution[node] == eigensign_solution[neighbor]:
-                        if neighbor_type == 0:  # positive edge
-                            consistent_degree += 1
-                        else:  # negative edge
-                            inconsistent_degree[node] += 1
-                    else:
-                        if neighbor_type == 0:  # positive edge
-                            inconsistent_degree[node] += 1
-                        else:  # negative edge
-                            consistent_degree += 1
-            
-            degree[node] = consistent_degree - inconsistent_degree[node] + l_v[node]
-            degree_sets[degree[node]].add(node)
-
-        # Pick a lowest eigensign degree node
-        nodes = solution.copy()
+        # Bucket queue over the degrees (a degree only moves within [l_v - inconsistent, l_v + consistent])
+        queue = BucketQueue(signed_graph.number_of_nodes, (l_v - eigensign_inconsistent_degree).min(initial=0), (l_v + eigensign_consistent_degree).max(initial=0))
+        queue.insert_all(np.arange(signed_graph.number_of_nodes), degree)
+        loads = memoryview(l_v)
+        positive_loads = memoryview(positive_load)
+
+        # Pick a lowest eigensign degree node (the best solution of the iteration is rebuilt from the removal log)
         x = solution_x.copy()
-        while degree_sets:
-            lowest_degree = min(degree_sets.keys())
-            while degree_sets[lowest_degree]:
-                node = degree_sets[lowest_degree].pop()
-
-                l_v[node] = lowest_degree
-
-                # Update max_inconsistent_degree
-                max_inconsistent_degree = max(max_inconsistent_degree, inconsistent_degree[node])
-
-                # Update the eigensign degree of its neighbors
-                for neighbor_type in [0, 1]:
-                    for neighbor in signed_graph.adjacency_list[node][neighbor_type]:
-                        if neighbor in nodes:
-                            old_degree = degree[neighbor]
-                            degree_sets[old_degree].remove(neighbor)
-
-                            if eigensign_solution[node] == eigensign_solution[neighbor]:
-                                if neighbor_type == 0:  # positive edge
-                                    degree[neighbor] -= 1
-                                else:  # negative edge
-                                    degree[neighbor] += 1
-                                    inconsistent_degree[neighbor] -= 1
-                            else:
-                                if neighbor_type == 0:  # positive edge
-                                    degree[neighbor] += 1
-                                    inconsistent_degree[neighbor] -= 1
-                                else:  # negative edge
-                                    degree[neighbor] -= 1
-
-                            degree_sets[degree[neighbor]].add(neighbor)
-                            lowest_degree = min(lowest_degree, degree[neighbor])
-
-                # Remove the node from the current set of nodes
-                nodes.remove(node)
-
-                # Update the solution if needed
-                x[node] = 0
-                objective_function = evaluate_objective_function(signed_graph, x)
-                if objective_function > solution_objective_function:
-                    solution = nodes.copy()
-                    solution_x = x.copy()
-                    solution_objective_function = objective_function
-
-            # Remove the empty set from the dict
-            if not degree_sets[lowest_degree]:
-                del degree_sets[lowest_degree]
+        initial_x = solution_x
+        removal_order = []
+        densities = [solution_objective_function]
+        best_step = 0
+        while queue:
+            node, lowest_degree = queue.pop_min()
+
+            # the degree is (consistent - inconsistent) + previous load
+            positive_loads[node] += lowest_degree - loads[node] + inconsistent_degree[node]
+            loads[node] = lowest_degree
+
+            # Update max_inconsistent_degree
+            max_inconsistent_degree = max(max_inconsistent_degree, inconsistent_degree[node])
+
+            # Update the eigensign degree of its neighbors (+1 for a consistent edge, -1 for an inconsistent one)
+            node_sign = signs[node]
+            start, end = indptr[node], indptr[node + 1]
+            for neighbor, edge_sign in zip(indices[start:end].tolist(), data[start:end].astype(np.int64).tolist()):
+                if neighbor in queue:
+                    consistency = edge_sign * node_sign * signs[neighbor]
+                    queue.update(neighbor, queue.get_key(neighbor) - consistency)
+                    if consistency < 0:
+                        inconsistent_degree[neighbor] -= 1
+
+            # Remove the node from the current set of nodes
+            removal_order.append(node)
+
+            # Update the solution if needed (only the edges of node change the objective function)
+            numerator, denominator = remove_node_from_terms(signed_graph, x, node, numerator, denominator)
+            objective_function = objective_function_from_terms(numerator, denominator)
+            if debug:
+                check_objective_function(signed_graph, x, objective_function)
+            densities.append(objective_function)
+            if objective_function > solution_objective_function:
+                best_step = len(removal_order)
+                solution_objective_function = objective_function
+
+        solution_x, solution = rebuild_peeled_solution(initial_x, removal_order, best_step)
+        traces.append(build_peeling_trace(removal_order, densities))
+
+        # Update best solution if needed
+        if solution_objective_function > best_objective_function:
+            best_solution = solution
+            best_solution_x = solution_x
+            best_objective_function = solution_objective_function
+
+        overall_max_inconsistent_degree = max(overall_max_inconsistent_degree, max_inconsistent_degree)
+
+        # Tighten the bound of the start's sign pattern with the loads
+        sign_pattern_bound = min(sign_pattern_bound, 2 * positive_load.max(initial=0) / (iteration + 1))
 
         # Check convergence if flag is set
         if use_convergence and previous_objective is not None:
@@ -206,25 +247,87 @@ def greedy2PC_plus_plus(signed_graph, eigensign_solution, T, print_results=True,
         previous_objective = solution_objective_function
         iteration += 1
 
+        # Stop as soon as the best solution is within the requested (relative) gap from the best one with the start's signs
+        if gap is not None and sign_pattern_bound - best_objective_function <= gap * abs(sign_pattern_bound):
+            break
+
         # Check iteration limit if not using convergence
         if not use_convergence and iteration >= T:
             break
 
-        # Update best solution if needed
-        if solution_objective_function > best_objective_function:
-            best_solution = solution
-            best_solution_x = solution_x
-            best_objective_function = solution_objective_function
+    execution_time.end_algorithm()
 
-        overall_max_inconsistent_degree = max(overall_max_inconsistent_degree, max_inconsistent_degree)
+    # Output the best solution found across all iterations
+    if print_results:
+        print_end_algorithm(execution_time.execution_time_seconds, [best_solution_x], signed_graph, [best_objective_function])
+
+    if return_trace:
+        return best_solution, best_solution_x, overall_max_inconsistent_degree, iteration, upper_bound, sign_pattern_bound, traces
+
+    return best_solution, best_solution_x, overall_max_inconsistent_degree, iteration, upper_bound, sign_pattern_bound
+
+
+def greedy2PC_multi_start(signed_graph, k=4, perturbations=0, perturbation_rate=0.05, T=None, workers=1, seed=None, print_results=True, **options):
+    execution_time = ExecutionTime()
+
+    # Starting sign patterns: the signs of the top-k eigenvectors, each followed by random perturbations that flip
+    # every sign with probability perturbation_rate
+    eigenvectors = get_top_eigenvectors(signed_graph, k)
+    rng = np.random.default_rng(seed)
+    starts = []
+    labels = []
+    for i in range(eigenvectors.shape[1]):
+        start_x = np.where(eigenvectors[:, i] >= 0, 1, -1)
+        starts.append(start_x)
+        labels.append({"eigenvector": i})
+        for j in range(perturbations):
+            starts.append(np.where(rng.random(signed_graph.number_of_nodes) < perturbation_rate, -start_x, start_x))
+            labels.append({"eigenvector": i, "perturbation": j + 1})
+
+    # Peel from every start with greedy2PC (T is None) or greedy2PC++, on a process pool if more than one worker is requested
+    if workers > 1 and len(starts) > 1:
+        with signed_graph.share() as shared_graph:
+            with ProcessPoolExecutor(max_workers=workers, initializer=initialize_worker, initargs=(shared_graph.descriptor, get_default_eigensolver())) as executor:
+                results = list(executor.map(worker_run_start, starts, [T] * len(starts), [options] * len(starts)))
+    else:
+        results = [run_start(signed_graph, start_x, T, options) for start_x in starts]
+
+    # Per-start statistics, and best solution over all the starts
+    statistics = [{**label, "polarity": polarity, "maximum_inconsistent_degree": max_inconsistent_degree, "running_time": running_time}
+                  for label, (_, polarity, max_inconsistent_degree, running_time) in zip(labels, results)]
+    best = int(np.argmax([np.nan_to_num(polarity, nan=-np.inf) for _, polarity, _, _ in results]))
+    best_solution_x, best_objective_function, max_inconsistent_degree, _ = results[best]
+    best_solution = set(np.flatnonzero(best_solution_x).tolist())
 
     execution_time.end_algorithm()
 
-    # Output the best solution found across all iterations
     if print_results:
         print_end_algorithm(execution_time.execution_time_seconds, [best_solution_x], signed_graph, [best_objective_function])
 
-    return best_solution, best_solution_x, overall_max_inconsistent_degree, iteration if use_convergence else T
+    return best_solution, best_solution_x, max_inconsistent_degree, statistics
+
+
+def run_start(signed_graph, start_x, T, options):
+    # solution, objective function, maximum inconsistent degree and running time of one start
+    execution_time = ExecutionTime()
+    if T is None:
+        _, solution_x, max_inconsistent_degree = greedy2PC(signed_graph, start_x, print_results=False)
+    else:
+        _, solution_x, max_inconsistent_degree, _, _, _ = greedy2PC_plus_plus(signed_graph, start_x, T, print_results=False, **options)
+    execution_time.end_algorithm()
+    return solution_x, evaluate_objective_function(signed_graph, solution_x), max_inconsistent_degree, execution_time.execution_time_seconds
+
+
+# graph of the worker processes of greedy2PC_multi_start
+worker_signed_graph = None
+
 
+def initialize_worker(descriptor, eigensolver):
+    # the graph is attached from shared memory with its cached eigenpair, which the eigensolver of the parent process accepts
+    global worker_signed_graph
+    worker_signed_graph = attach_signed_graph(descriptor)
+    set_default_eigensolver(eigensolver)
 
 
+def worker_run_start(start_x, T, options):
+    return run_start(worker_signed_graph, start_x, T, options)
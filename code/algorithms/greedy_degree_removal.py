@@ -3,12 +3,13 @@ from algorithms.subroutines.commons import *
 from utilities.time_measure import ExecutionTime
 from utilities.print_console import print_end_algorithm
 
-def greedy_degree_removal(signed_graph, signed_degree=True, print_results=True):
+def greedy_degree_removal(signed_graph, signed_degree=True, print_results=True, debug=False, return_trace=False):
     execution_time = ExecutionTime()
 
     solution = set(signed_graph.nodes_iterator)
     solution_x = build_x(signed_graph, solution)
-    solution_objective_function = evaluate_objective_function(signed_graph, solution_x)
+    numerator, denominator = evaluate_objective_function_terms(signed_graph, solution_x)
+    solution_objective_function = objective_function_from_terms(numerator, denominator)
 
     degree = [len(neighbors[0]) - (len(neighbors[1]) if signed_degree else 0) 
               for neighbors in signed_graph.adjacency_list]
@@ -18,6 +19,11 @@ def greedy_degree_removal(signed_graph, signed_degree=True, print_results=True):
     nodes = solution.copy()
     x = solution_x.copy()
 
+    # log the removals; the best solution is rebuilt from the log at the end
+    removal_order = []
+    densities = [solution_objective_function]
+    best_step = 0
+
     while degree_heap:
         _, node = heappop(degree_heap)
         
@@ -25,7 +31,13 @@ def greedy_degree_removal(signed_graph, signed_degree=True, print_results=True):
             continue
 
         nodes.remove(node)
-        x[node] = 0
+        removal_order.append(node)
+
+        # update the objective function from the edges of node only
+        numerator, denominator = remove_node_from_terms(signed_graph, x, node, numerator, denominator)
+        objective_function = objective_function_from_terms(numerator, denominator)
+        if debug:
+            check_objective_function(signed_graph, x, objective_function)
 
         for neighbor_type, sign in [(0, -1), (1, 1)]:
             for neighbor in signed_graph.adjacency_list[node][neighbor_type]:
@@ -34,17 +46,21 @@ def greedy_degree_removal(signed_graph, signed_degree=True, print_results=True):
                         degree[neighbor] += sign
                         heappush(degree_heap, (degree[neighbor], neighbor))
 
-        objective_function = evaluate_objective_function(signed_graph, x)
+        densities.append(objective_function)
         if objective_function > solution_objective_function:
-            solution = nodes.copy()
-            solution_x = x.copy()
+            best_step = len(removal_order)
             solution_objective_function = objective_function
 
+    solution_x, solution = rebuild_peeled_solution(solution_x, removal_order, best_step)
+
     execution_time.end_algorithm()
 
     if print_results:
         print_end_algorithm(execution_time.execution_time_seconds, [solution_x], signed_graph, [solution_objective_function])
 
+    if return_trace:
+        return solution, solution_x, build_peeling_trace(removal_order, densities)
+
     return solution, solution_x
 
 # def optimized_greedy_degree_removal(signed_graph, signed_degree=True):
@@ -1,71 +1,117 @@
 import random
 
 from algorithms.bansal import bansal
+from algorithms.eigensign import eigensign_binary
+from algorithms.greedy2PC import greedy2PC
 from algorithms.subroutines.commons import *
+from algorithms.subroutines.bucket_queue import BucketQueue
 from utilities.time_measure import ExecutionTime
 from utilities.print_console import print_end_algorithm
 
 
-def local_search(signed_graph, maximum_changes, convergence_threshold, partial_solution='r', print_results=True):
+def local_search(signed_graph, maximum_changes, convergence_threshold, partial_solution='r', print_results=True, initial_x=None, swaps=True):
     # start of the algorithm
     execution_time = ExecutionTime()
 
-    # solution and value of the objective function
-    if partial_solution == 'b':
-        solution, _, original_x = bansal(signed_graph, verbose=False)
-    else:
-        solution = random_solution(signed_graph)
-        original_x = build_x(signed_graph, set(signed_graph.nodes_iterator))
-    solution_x = build_x(signed_graph, solution, eigenvector=original_x)
-    solution_objective_function = evaluate_objective_function(signed_graph, solution_x)
-
-    # while there might be improvements to the solution
-    improvable = True
-    changes = 0
-    while improvable and (maximum_changes is None or changes < maximum_changes):
-        # find the node of highest gain
-        best_node = None
-        best_gain = .0
-
-        # move each node in or out the solution
-        for node in signed_graph.nodes_iterator:
-            if node in solution:
-                solution.remove(node)
-                solution_x[node] = 0
-
-                objective_function = evaluate_objective_function(signed_graph, solution_x)
-
-                solution.add(node)
-                solution_x[node] = original_x[node]
-            else:
-                solution.add(node)
-                solution_x[node] = original_x[node]
-
-                objective_function = evaluate_objective_function(signed_graph, solution_x)
+    # starting solution: random ('r'), bansal ('b'), greedy2PC ('g') or the given vector
+    if initial_x is None:
+        if partial_solution == 'b':
+            _, initial_x = bansal(signed_graph, print_results=False)
+        elif partial_solution == 'g':
+            _, eigensign_binary_solution, _ = eigensign_binary(signed_graph, print_results=False)
+            _, initial_x, _ = greedy2PC(signed_graph, eigensign_binary_solution, print_results=False)
+        else:
+            initial_x = build_x(signed_graph, random_solution(signed_graph))
+
+    # side taken by a node entering the solution (without swaps): its side in the starting solution,
+    # or the sign of its entry in the maximum eigenvector
+    solution_x = np.sign(initial_x).astype(np.int64)
+    sides = np.where(get_maximum_eigenvector(signed_graph) < 0, -1, 1)
+    sides = np.where(solution_x != 0, solution_x, sides)
+
+    # y = A x, and terms of the objective function
+    y = np.rint(signed_graph.get_adjacency_operator().dot(solution_x.astype('d'))).astype(np.int64)
+    numerator = int(solution_x.dot(y))
+    denominator = int(np.count_nonzero(solution_x))
+
+    # For a fixed solution size, the gains of removing or swapping a node of the solution only depend on x_u (A x)_u,
+    # and the gain of adding a node only depends on s_u (A x)_u, s_u being its side: one indexed queue per move type
+    # gives the best move, and a move only changes the keys of the neighbors of the moved node
+    maximum_degree = int(signed_graph.get_degrees().max(initial=0))
+    inside = BucketQueue(signed_graph.number_of_nodes, -maximum_degree, maximum_degree)
+    outside = BucketQueue(signed_graph.number_of_nodes, -maximum_degree, maximum_degree)
+    inside_nodes = np.flatnonzero(solution_x)
+    outside_nodes = np.flatnonzero(solution_x == 0)
+    inside.insert_all(inside_nodes, solution_x[inside_nodes] * y[inside_nodes])
+    outside.insert_all(outside_nodes, -np.abs(y[outside_nodes]) if swaps else -sides[outside_nodes] * y[outside_nodes])
+
+    x, y_view, sides = memoryview(solution_x), memoryview(y), memoryview(sides)
+    indptr, indices, data = signed_graph.indptr, signed_graph.indices, signed_graph.data
+
+    def outside_key(node):
+        return -abs(y_view[node]) if swaps else -sides[node] * y_view[node]
 
-                solution.remove(node)
-                solution_x[node] = 0
+    changes = 0
+    while maximum_changes is None or changes < maximum_changes:
+        # the empty solution counts as 0
+        objective_function = numerator / denominator if denominator else 0.0
 
-            # update the node of highest gain
-            gain = objective_function - solution_objective_function
+        # find the best move among removal, swap and addition (move, node, new value of x, gain)
+        best_move = None
+        best_gain = .0
+        if inside:
+            node, key = inside.peek_min()
+            if denominator > 1:
+                gain = (numerator - 2 * key) / (denominator - 1) - objective_function
+                if gain > best_gain:
+                    best_move, best_gain = ('remove', node, 0), gain
+            if swaps:
+                gain = (numerator - 4 * key) / denominator - objective_function
+                if gain > best_gain:
+                    best_move, best_gain = ('swap', node, -x[node]), gain
+        if outside:
+            node, key = outside.peek_min()
+            gain = (numerator - 2 * key) / (denominator + 1) - objective_function
             if gain > best_gain:
-                best_node = node
-                best_gain = gain
-
-        # update the solution if there is a considerable gain
-        if best_gain >= convergence_threshold:
-            if best_node in solution:
-                solution.remove(best_node)
-                solution_x[best_node] = 0
+                side = (1 if y_view[node] > 0 else -1) if swaps and y_view[node] != 0 else sides[node]
+                best_move, best_gain = ('add', node, side), gain
+
+        # stop the algorithm if there is no considerable gain
+        if best_move is None or best_gain < convergence_threshold:
+            break
+
+        # apply the move (A has no self loops, so x^T A x changes by 2 delta (A x)_node)
+        move, node, value = best_move
+        delta = value - x[node]
+        numerator += 2 * delta * y_view[node]
+        x[node] = value
+        if move == 'remove':
+            inside.remove(node)
+            outside.insert(node, outside_key(node))
+            denominator -= 1
+        elif move == 'add':
+            outside.remove(node)
+            inside.insert(node, value * y_view[node])
+            sides[node] = value
+            denominator += 1
+        else:
+            inside.update(node, value * y_view[node])
+            sides[node] = value
+
+        # update A x and the keys of the neighbors
+        start, end = indptr[node], indptr[node + 1]
+        for neighbor, edge_sign in zip(indices[start:end].tolist(), data[start:end].astype(np.int64).tolist()):
+            y_view[neighbor] += edge_sign * delta
+            if neighbor in inside:
+                inside.update(neighbor, x[neighbor] * y_view[neighbor])
             else:
-                solution.add(best_node)
-                solution_x[best_node] = original_x[best_node]
+                outside.update(neighbor, outside_key(neighbor))
 
-            solution_objective_function = evaluate_objective_function(signed_graph, solution_x)
-            changes += 1
-        else:
-            # stop the algorithm otherwise
-            improvable = False
+        changes += 1
+
+    solution_x = solution_x.astype('d')
+    solution = set(np.flatnonzero(solution_x).tolist())
+    solution_objective_function = objective_function_from_terms(numerator, denominator)
 
     # end of the algorithm
     execution_time.end_algorithm()
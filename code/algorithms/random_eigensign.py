@@ -1,18 +1,16 @@
+from concurrent.futures import ThreadPoolExecutor
 from algorithms.subroutines.commons import *
 from utilities.time_measure import ExecutionTime
 from utilities.print_console import print_end_algorithm
 
 
-def random_eigensign(signed_graph, beta, maximum_eigenvector=None, execution_time_seconds=None, print_results=True):
+def random_eigensign(signed_graph, beta, maximum_eigenvector=None, execution_time_seconds=None, print_results=True, samples=1, seed=None, workers=1, batch_size=64):
     # start of the algorithm
     execution_time = ExecutionTime()
 
     if maximum_eigenvector is None:
-        # obtain the adjacency matrix
-        a = signed_graph.get_adjacency_matrix()
-
         # get the eigenvector corresponding to the maximum eigenvalue
-        maximum_eigenvector = np.squeeze(eigsh(a, k=1, which='LA')[1])
+        maximum_eigenvector = get_maximum_eigenvector(signed_graph)
 
         # consolidate beta
         if beta == 'l1':
@@ -22,17 +20,21 @@ def random_eigensign(signed_graph, beta, maximum_eigenvector=None, execution_tim
         else:
             beta = float(beta)
 
-        # multiply the maximum eigenvector by beta
-        maximum_eigenvector *= beta
+        # multiply the maximum eigenvector by beta (the cached eigenvector is left untouched)
+        maximum_eigenvector = maximum_eigenvector * beta
+
+    # one random stream per sample, so that the samples do not depend on how they are split across the workers
+    streams = np.random.SeedSequence(seed).spawn(samples)
+    batches = [streams[start:start + batch_size] for start in range(0, samples, batch_size)]
 
-    # compute x
-    x = np.array([0 for _ in signed_graph.nodes_iterator])
-    for node, element in enumerate(maximum_eigenvector):
-        # check the probability for a certain number of times
-        if np.random.choice((True, False), p=(min(np.abs(element), 1), max(1 - np.abs(element), 0))):
-            x[node] = np.sign(element)
-    
-    polarity = evaluate_objective_function(signed_graph, x)
+    # draw and score the samples batch by batch, keeping the best one
+    if workers > 1 and len(batches) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda batch: sample_batch(signed_graph, maximum_eigenvector, batch), batches))
+    else:
+        results = [sample_batch(signed_graph, maximum_eigenvector, batch) for batch in batches]
+    best = int(np.argmax([np.nan_to_num(polarity, nan=-np.inf) for _, polarity in results]))
+    x, polarity = results[best]
 
     # build the solution
     solution = build_solution(x)
@@ -48,3 +50,16 @@ def random_eigensign(signed_graph, beta, maximum_eigenvector=None, execution_tim
 
     # return the solution
     return solution, x, maximum_eigenvector, execution_time_seconds, beta
+
+
+def sample_batch(signed_graph, maximum_eigenvector, streams):
+    # every node enters x with probability min(|v|, 1) and the sign of v, one Bernoulli draw per node and sample;
+    # returns the best sample of the batch and its objective function
+    probabilities = np.minimum(np.abs(maximum_eigenvector), 1)
+    xs = np.empty((signed_graph.number_of_nodes, len(streams)))
+    for i, stream in enumerate(streams):
+        xs[:, i] = np.where(np.random.default_rng(stream).random(signed_graph.number_of_nodes) < probabilities, np.sign(maximum_eigenvector), 0)
+
+    polarities = evaluate_objective_functions(signed_graph, xs)
+    best = int(np.argmax(np.nan_to_num(polarities, nan=-np.inf)))
+    return xs[:, best], polarities[best]
@@ -0,0 +1,119 @@
+import numpy as np
+
+
+class BucketQueue:
+    # min-priority queue over the node ids 0..n-1 with integer keys in [minimum_key, maximum_key]:
+    # one doubly linked list of nodes per key, all stored in flat numpy arrays
+    # (the memoryviews give fast access to single elements from python)
+
+    def __init__(self, number_of_nodes, minimum_key, maximum_key):
+        # keys are shifted by offset to index the bucket heads, so negative keys are allowed
+        self.offset = -int(minimum_key)
+        self.number_of_buckets = int(maximum_key) - int(minimum_key) + 1
+
+        self.head = np.full(self.number_of_buckets, -1, dtype=np.int64)
+        self.next = np.full(number_of_nodes, -1, dtype=np.int64)
+        self.previous = np.full(number_of_nodes, -1, dtype=np.int64)
+        self.key = np.zeros(number_of_nodes, dtype=np.int64)
+        self.queued = np.zeros(number_of_nodes, dtype=np.bool_)
+
+        self._head = memoryview(self.head)
+        self._next = memoryview(self.next)
+        self._previous = memoryview(self.previous)
+        self._key = memoryview(self.key)
+        self._queued = memoryview(self.queued)
+
+        # number of queued nodes and lowest bucket that may be non-empty
+        self.size = 0
+        self.minimum_bucket = self.number_of_buckets
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, node):
+        return self._queued[node]
+
+    def insert_all(self, nodes, keys):
+        # vectorized insertion of many nodes: every bucket list is built from the nodes sorted by key
+        nodes = np.asarray(nodes, dtype=np.int64)
+        buckets = np.asarray(keys, dtype=np.int64) + self.offset
+        if len(nodes) == 0:
+            return
+        if buckets.min() < 0 or buckets.max() >= self.number_of_buckets:
+            raise ValueError('keys out of the range of the bucket queue')
+        if self.queued[nodes].any():
+            raise ValueError('nodes already in the bucket queue')
+
+        order = np.argsort(buckets, kind='stable')
+        nodes, buckets = nodes[order], buckets[order]
+        first = np.ones(len(nodes), dtype=bool)
+        first[1:] = buckets[1:] != buckets[:-1]
+        last = np.ones(len(nodes), dtype=bool)
+        last[:-1] = first[1:]
+
+        # link each node to its neighbors in the same bucket, and append the current list of the bucket at the end
+        self.next[nodes[:-1]] = np.where(last[:-1], -1, nodes[1:])
+        self.previous[nodes[1:]] = np.where(first[1:], -1, nodes[:-1])
+        self.previous[nodes[0]] = -1
+        self.next[nodes[-1]] = -1
+        old_heads = self.head[buckets[last]]
+        self.next[nodes[last]] = old_heads
+        linked = old_heads >= 0
+        self.previous[old_heads[linked]] = nodes[last][linked]
+        self.head[buckets[first]] = nodes[first]
+
+        self.key[nodes] = buckets - self.offset
+        self.queued[nodes] = True
+        self.size += len(nodes)
+        self.minimum_bucket = min(self.minimum_bucket, int(buckets[0]))
+
+    def insert(self, node, key):
+        bucket = key + self.offset
+        head = self._head[bucket]
+        self._next[node] = head
+        self._previous[node] = -1
+        if head >= 0:
+            self._previous[head] = node
+        self._head[bucket] = node
+        self._key[node] = key
+        self._queued[node] = True
+        self.size += 1
+        if bucket < self.minimum_bucket:
+            self.minimum_bucket = bucket
+
+    def remove(self, node):
+        # unlink the node from its bucket
+        next_node, previous_node = self._next[node], self._previous[node]
+        if previous_node >= 0:
+            self._next[previous_node] = next_node
+        else:
+            self._head[self._key[node] + self.offset] = next_node
+        if next_node >= 0:
+            self._previous[next_node] = previous_node
+        self._queued[node] = False
+        self.size -= 1
+
+    def update(self, node, key):
+        # move the node to the bucket of its new key
+        self.remove(node)
+        self.insert(node, key)
+
+    def get_key(self, node):
+        return self._key[node]
+
+    def peek_min(self):
+        # return a node of minimum key, together with its key, without removing it
+        if self.size == 0:
+            raise IndexError('peek from an empty bucket queue')
+        while self._head[self.minimum_bucket] < 0:
+            self.minimum_bucket += 1
+        node = self._head[self.minimum_bucket]
+        return node, self._key[node]
+
+    def pop_min(self):
+        # remove and return a node of minimum key, together with its key
+        if self.size == 0:
+            raise IndexError('pop from an empty bucket queue')
+        node, key = self.peek_min()
+        self.remove(node)
+        return node, key
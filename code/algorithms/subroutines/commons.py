@@ -1,18 +1,156 @@
+from scipy.sparse import issparse
 from scipy.sparse.linalg import eigsh
+from algorithms.subroutines.eigensolvers import get_default_eigensolver
 import numpy as np
 
+def get_maximum_eigenpair(signed_graph):
+    # maximum eigenvalue and corresponding eigenvector of the adjacency matrix (computed by the default eigensolver),
+    # cached on the graph
+    return signed_graph.get_leading_eigenpair(get_default_eigensolver())
+
+def get_maximum_eigenvector(signed_graph):
+    return get_maximum_eigenpair(signed_graph)[1]
+
+def get_top_eigenvectors(signed_graph, k):
+    # eigenvectors of the k largest eigenvalues of the adjacency matrix (as columns, by decreasing eigenvalue),
+    # from one eigsh call; the first one is the cached maximum eigenvector
+    if k <= 1:
+        return get_maximum_eigenvector(signed_graph).reshape(-1, 1)
+    values, vectors = eigsh(signed_graph.get_adjacency_operator(), k=min(k, signed_graph.number_of_nodes - 1), which='LA', v0=get_maximum_eigenvector(signed_graph))
+    return vectors[:, np.argsort(-values)]
+
 def evaluate_objective_function(signed_graph, x):
     # special case with no nodes in the solution
     if x.dot(x) == 0:
         return np.nan
 
-    # obtain the adjacency matrix
-    a = signed_graph.get_adjacency_matrix()
+    # obtain the adjacency matrix (a multithreaded operator when more threads are configured)
+    a = signed_graph.get_adjacency_operator()
 
     # compute the objective function
     a_dot_x = a.dot(x)
     return x.dot(a_dot_x) / x.dot(x)
 
+def evaluate_objective_functions(signed_graph, xs, agreement_ratios=False):
+    # objective functions (and agreement ratios) of many candidates at once, the columns of xs (a dense array
+    # or a sparse matrix), from one sparse matrix-matrix product per term
+    if issparse(xs):
+        xs = xs.tocsc().astype('d')
+        a, unsigned_a = signed_graph.get_adjacency_matrix(), signed_graph.get_unsigned_adjacency_matrix()
+    else:
+        xs = np.asarray(xs, dtype='d').reshape(signed_graph.number_of_nodes, -1)
+        a, unsigned_a = signed_graph.get_adjacency_operator(), signed_graph.get_unsigned_adjacency_operator()
+
+    # special case with no nodes in the solution
+    numerators, denominators = quadratic_forms(a, xs), quadratic_forms(None, xs)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        objective_functions = np.where(denominators != 0, numerators / denominators, np.nan)
+    if not agreement_ratios:
+        return objective_functions
+
+    # with memberships z in {-1, 0, 1} (the entries of x equal to 1 and -1), z^T |A| z counts twice the edges among
+    # the members and z^T A z counts twice the agreeing (positive internal, negative across) minus the disagreeing ones
+    memberships = (xs == 1).astype('d') - (xs == -1).astype('d')
+    agreements, edges = quadratic_forms(a, memberships), quadratic_forms(unsigned_a, abs(memberships))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratios = np.where(edges != 0, (edges + agreements) / (2 * edges), 0.0)
+    return objective_functions, ratios
+
+# metrics computed by evaluate_solutions, in order
+SOLUTION_METRICS = ('polarity', 'agreement_ratio', 'size_S1', 'size_S2', 'internal_positive_S1', 'internal_negative_S1',
+                    'internal_positive_S2', 'internal_negative_S2', 'cross_positive', 'cross_negative', 'cut_positive', 'cut_negative')
+
+def evaluate_solutions(signed_graph, xs, block_size=2 ** 22):
+    # metrics of the solutions in the columns of xs (S1: entries equal to 1, S2: entries equal to -1), as a dict of
+    # arrays with one value per column: polarity, agreement ratio, community sizes, positive and negative edges inside
+    # S1, inside S2 and across them, and edges cut between the communities and the rest of the graph. Every edge class
+    # of every solution is counted in one pass over the CSR arrays (block_size entries times solutions at a time)
+    xs = np.asarray(xs, dtype='d').reshape(signed_graph.number_of_nodes, -1)
+    metrics = count_edge_classes(signed_graph, xs, block_size)
+    return {name: metrics[name] for name in SOLUTION_METRICS}
+
+def count_edge_classes(signed_graph, xs, block_size=2 ** 22):
+    # each stored entry (row r, column c, sign) adds one to the class (z_r, z_c, sign) of every solution, where z is
+    # the membership (1, 0 or -1): one bincount over the class codes of a block of entries for all the solutions
+    memberships = (xs == 1).astype(np.int8) - (xs == -1).astype(np.int8)
+    k = memberships.shape[1]
+    offsets = 18 * np.arange(k)
+    counts = np.zeros(18 * k, dtype=np.int64)
+
+    # the temporaries of a block have one entry per stored entry and solution
+    block_size = max(1, block_size // max(k, 1))
+    for start in range(0, len(signed_graph.indices), block_size):
+        end = min(start + block_size, len(signed_graph.indices))
+        rows = np.searchsorted(signed_graph.indptr, np.arange(start, end), side='right') - 1
+        codes = 2 * (3 * (memberships[rows] + 1) + memberships[signed_graph.indices[start:end]] + 1) + (signed_graph.data[start:end] > 0)[:, None]
+        counts += np.bincount((codes + offsets).ravel(), minlength=18 * k)
+
+    # counts[j, z_r + 1, z_c + 1, positive]; the edges inside the solution are stored in both directions
+    counts = counts.reshape(k, 3, 3, 2)
+    metrics = {
+        'size_S1': np.count_nonzero(memberships == 1, axis=0),
+        'size_S2': np.count_nonzero(memberships == -1, axis=0),
+        'internal_positive_S1': counts[:, 2, 2, 1] // 2,
+        'internal_negative_S1': counts[:, 2, 2, 0] // 2,
+        'internal_positive_S2': counts[:, 0, 0, 1] // 2,
+        'internal_negative_S2': counts[:, 0, 0, 0] // 2,
+        'cross_positive': counts[:, 2, 0, 1],
+        'cross_negative': counts[:, 2, 0, 0],
+        'cut_positive': counts[:, 2, 1, 1] + counts[:, 0, 1, 1],
+        'cut_negative': counts[:, 2, 1, 0] + counts[:, 0, 1, 0],
+    }
+
+    # agreeing edges are positive inside a community or negative across them
+    agreeing = metrics['internal_positive_S1'] + metrics['internal_positive_S2'] + metrics['cross_negative']
+    disagreeing = metrics['internal_negative_S1'] + metrics['internal_negative_S2'] + metrics['cross_positive']
+    sizes = metrics['size_S1'] + metrics['size_S2']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        metrics['polarity'] = np.where(sizes != 0, 2 * (agreeing - disagreeing) / sizes, np.nan)
+        metrics['agreement_ratio'] = np.where(agreeing + disagreeing != 0, agreeing / (agreeing + disagreeing), 0.0)
+
+    # the counts give the objective function of vectors in {-1, 0, 1} only
+    fractional = np.flatnonzero(np.any(memberships != xs, axis=0))
+    if len(fractional):
+        metrics['polarity'][fractional] = evaluate_objective_functions(signed_graph, xs[:, fractional])
+
+    return metrics
+
+def quadratic_forms(a, xs):
+    # x^T A x for every column x of xs (x^T x when a is None)
+    a_dot_xs = xs if a is None else a.dot(xs)
+    if issparse(xs):
+        return np.asarray(xs.multiply(a_dot_xs).sum(axis=0)).ravel()
+    return np.einsum('ij,ij->j', xs, a_dot_xs)
+
+def evaluate_objective_function_terms(signed_graph, x):
+    # numerator (x^T A x) and denominator (x^T x) of the objective function
+    a = signed_graph.get_adjacency_operator()
+    return x.dot(a.dot(x)), x.dot(x)
+
+def objective_function_from_terms(numerator, denominator):
+    # special case with no nodes in the solution
+    if denominator == 0:
+        return np.nan
+    return numerator / denominator
+
+def node_contribution(signed_graph, x, node):
+    # (A x)[node], computed from the edges of node only
+    start, end = signed_graph.indptr[node], signed_graph.indptr[node + 1]
+    return signed_graph.data[start:end].dot(x[signed_graph.indices[start:end]])
+
+def remove_node_from_terms(signed_graph, x, node, numerator, denominator):
+    # update the terms of the objective function in O(deg(node)) and set x[node] to 0
+    numerator -= 2 * x[node] * node_contribution(signed_graph, x, node)
+    denominator -= x[node] * x[node]
+    x[node] = 0
+    return numerator, denominator
+
+def check_objective_function(signed_graph, x, objective_function):
+    # debug: compare an incrementally maintained objective function with the full evaluation
+    expected_objective_function = evaluate_objective_function(signed_graph, x)
+    assert np.isclose(objective_function, expected_objective_function, equal_nan=True), \
+        'incremental objective function {} differs from the full evaluation {}'.format(objective_function, expected_objective_function)
+
 def build_solution(x):
     # return the nodes having the corresponding index of x different from 0
     return {node for node, element in enumerate(x) if element != 0}
@@ -21,12 +159,54 @@ def build_solution(x):
 def build_x(signed_graph, nodes, eigenvector=None):
     # get the maximum eigenvector of the adjacency matrix
     if eigenvector is None:
-        a = signed_graph.get_adjacency_matrix()
-        eigenvector = np.squeeze(eigsh(a, k=1, which='LA')[1])
+        eigenvector = get_maximum_eigenvector(signed_graph)
 
     # build x from the signs of the minimum eigenvector
     return np.array([np.sign(element) if node in nodes else 0 for node, element in enumerate(eigenvector)])
 
+def compute_eigensign_degrees(signed_graph, x):
+    # consistent minus inconsistent degree, diag(x) A x, and inconsistent degree of every node
+    # w.r.t. the signs of x, counting only the neighbors with x != 0
+    a = signed_graph.get_adjacency_operator()
+    signs = np.sign(x).astype('d')
+    active = np.abs(signs)
+    degree = signs * a.dot(signs)
+    inconsistent_degree = (active * signed_graph.get_unsigned_adjacency_operator().dot(active) - degree) / 2
+    return degree.astype(np.int64), inconsistent_degree.astype(np.int64)
+
+def sweep_thresholds(signed_graph, vector):
+    # objective function of x_t = sign(vector) restricted to |vector| >= t, for every distinct threshold t
+    # (returned in decreasing order): the nodes enter in order of decreasing |vector|, and an edge enters
+    # the numerator x^T A x when its second endpoint does
+    magnitude = np.abs(vector)
+    order = np.argsort(-magnitude, kind='stable')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    signs = np.sign(vector)
+
+    rows = np.repeat(np.arange(signed_graph.number_of_nodes), np.diff(signed_graph.indptr))
+    columns = signed_graph.indices
+    entering = np.maximum(rank[rows], rank[columns])
+    numerator = np.cumsum(np.bincount(entering, weights=signed_graph.data * signs[rows] * signs[columns], minlength=len(order)))
+    denominator = np.cumsum(signs[order] ** 2)
+
+    # evaluate only after the last node of every distinct threshold has entered
+    sorted_magnitude = magnitude[order]
+    last = np.flatnonzero(np.append(sorted_magnitude[1:] != sorted_magnitude[:-1], True))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        objective_functions = np.where(denominator[last] > 0, numerator[last] / denominator[last], np.nan)
+    return sorted_magnitude[last], objective_functions
+
+def rebuild_peeled_solution(x, removal_order, step):
+    # solution vector after the first step removals of a peeling that started from x
+    peeled_x = x.copy()
+    peeled_x[np.asarray(removal_order[:step], dtype=np.int64)] = 0
+    return peeled_x, set(np.flatnonzero(peeled_x).tolist())
+
+def build_peeling_trace(removal_order, densities):
+    # removal order and density after each step (densities[0] is the density before any removal)
+    return {"removal_order": np.asarray(removal_order, dtype=np.int64), "density": np.asarray(densities, dtype='d')}
+
 def build_solution_two_sets(x):
     # Separate nodes into S1 (value 1) and S2 (value -1)
     S1 = {node for node, element in enumerate(x) if element == 1}
@@ -45,59 +225,14 @@ def build_x_from_two_sets(signed_graph, S1, S2):
     
     return x
 
-def get_edges_clusters(A, membership):
-    cx = A.tocoo()
-    int_p1 = 0
-    int_p2 = 0
-    int_n1 = 0
-    int_n2 = 0
-    inter_p = 0
-    inter_n = 0
-    for i,j,v in zip(cx.row, cx.col, cx.data):
-        if (membership[i] == 1 or membership[i] == -1) and (membership[j] == 1 or membership[j] == -1):
-            ci = membership[i]
-            cj = membership[j]
-            if ci == cj:
-                if ci == 1:
-                    if v == 1:
-                        int_p1 += 1
-                    elif v == -1:
-                        int_n1 +=1
-                elif ci == -1:
-                    if v == 1:
-                        int_p2 += 1
-                    elif v == -1:
-                        int_n2 +=1
-            else:
-                if v == 1:
-                    inter_p += 1
-                elif v == -1:
-                    inter_n +=1
-    # each edge is counted twice in the previous loop
-    int_p1 /= 2
-    int_p2 /= 2
-    int_n1 /= 2
-    int_n2 /= 2
-    inter_p /= 2
-    inter_n /= 2
-    n1 = 0
-    n2 = 0
-    for v in membership:
-        if v == 1:
-            n1 += 1
-        elif v == 2:
-            n2 += 1
-    if n1 >= n2:
-        return int_p1, int_p2, int_n1, int_n2, inter_p, inter_n
-    else:
-        return int_p2, int_p1, int_n2, int_n1, inter_p, inter_n
+def get_edges_clusters(signed_graph, membership):
+    # positive and negative edges inside the larger community, inside the smaller one and across them
+    metrics = {name: values[0] for name, values in evaluate_solutions(signed_graph, membership).items()}
+    internal = [(metrics['internal_positive_S1'], metrics['internal_negative_S1']), (metrics['internal_positive_S2'], metrics['internal_negative_S2'])]
+    if metrics['size_S1'] < metrics['size_S2']:
+        internal.reverse()
+    (int_p1, int_n1), (int_p2, int_n2) = internal
+    return int_p1, int_p2, int_n1, int_n2, metrics['cross_positive'], metrics['cross_negative']
 
 def compute_agreement_ratio(signed_graph, x):
-    A = signed_graph.get_adjacency_matrix()
-    int_p1, int_p2, int_n1, int_n2, inter_p, inter_n = get_edges_clusters(A, x)
-    m = int_p1 + int_p2 + int_n1 + int_n2 + inter_p + inter_n
-    if m!= 0:
-        ag_ratio = ((int_p1) + (int_p2) + (inter_n))/m
-    else: 
-        ag_ratio = 0.0
-    return ag_ratio
\ No newline at end of file
+    return evaluate_solutions(signed_graph, x)['agreement_ratio'][0]
@@ -0,0 +1,188 @@
+import time
+import warnings
+import numpy as np
+from scipy.linalg import eigh, qr
+from scipy.sparse.linalg import ArpackNoConvergence, LinearOperator, eigsh, lobpcg
+
+# available methods for the leading (largest algebraic) eigenpair of the adjacency matrix
+EIGENSOLVER_METHODS = ('arpack', 'lobpcg', 'power', 'randomized')
+
+
+class TimeBudgetExceeded(Exception):
+    pass
+
+
+class RecordingOperator(LinearOperator):
+    # wraps a matrix, keeps the last products (x, A x) and stops the solver when the time budget is over
+
+    def __init__(self, a, deadline=None, window=20):
+        super().__init__(dtype=np.dtype('d'), shape=a.shape)
+        self.a = a
+        self.deadline = deadline
+        self.window = window
+        self.inputs = []
+        self.outputs = []
+        self.products = 0
+
+    def _matmat(self, x):
+        # the first product is always done, so that there is a recorded pair to return
+        if self.products > 0 and self.deadline is not None and time.time() > self.deadline:
+            raise TimeBudgetExceeded()
+        y = self.a.dot(x)
+        self.products += x.shape[1]
+        self.inputs.append(np.array(x))
+        self.outputs.append(np.array(y))
+        if len(self.inputs) > self.window:
+            del self.inputs[0], self.outputs[0]
+        return y
+
+    def _matvec(self, x):
+        return self._matmat(x.reshape(-1, 1)).ravel()
+
+    def best_recorded_pair(self):
+        # Rayleigh-Ritz on the span of the recorded vectors
+        return rayleigh_ritz(np.hstack(self.inputs), np.hstack(self.outputs))
+
+
+def rayleigh_ritz(x, a_x):
+    # leading Ritz pair (value, vector, A vector) of the span of the columns of x, given the products a_x = A x;
+    # the basis is orthonormalized through the Gram matrix, which also drops (nearly) dependent directions
+    gram_values, gram_vectors = eigh(x.T.dot(x))
+    keep = gram_values > 1e-12 * gram_values[-1]
+    transform = gram_vectors[:, keep] / np.sqrt(gram_values[keep])
+    q, a_q = x.dot(transform), a_x.dot(transform)
+    values, vectors = eigh(q.T.dot(a_q))
+    return values[-1], q.dot(vectors[:, -1]), a_q.dot(vectors[:, -1])
+
+
+def relative_residual(value, vector, a_vector):
+    # ||A v - lambda v|| / (|lambda| ||v||)
+    return np.linalg.norm(a_vector - value * vector) / (max(abs(value), 1e-300) * np.linalg.norm(vector))
+
+
+class EigenSolver:
+    # leading eigenpair solver with a tolerance (relative residual), an iteration cap and a wall-clock budget in seconds;
+    # calling it returns (value, vector, info) where info describes the solver and the residual it reached
+
+    def __init__(self, method='arpack', tol=0, maxiter=None, time_budget=None, block_size=4, seed=0):
+        if method not in EIGENSOLVER_METHODS:
+            raise ValueError('unknown eigensolver {} (available: {})'.format(method, ', '.join(EIGENSOLVER_METHODS)))
+        self.method = method
+        self.tol = tol
+        self.maxiter = maxiter
+        self.time_budget = time_budget
+        self.block_size = block_size
+        self.seed = seed
+
+    def __call__(self, a, v0=None):
+        start = time.time()
+        deadline = start + self.time_budget if self.time_budget is not None else None
+        rng = np.random.default_rng(self.seed)
+
+        value, vector, matvecs, stopped_by = getattr(self, self.method)(a, v0, deadline, rng)
+
+        # normalize, and measure the residual with one more product
+        vector = vector / np.linalg.norm(vector)
+        residual = relative_residual(value, vector, a.dot(vector))
+
+        info = {
+            "eigensolver": self.method,
+            "tol": self.tol,
+            "maxiter": self.maxiter,
+            "time_budget": self.time_budget,
+            "residual": float(residual),
+            "matvecs": int(matvecs),
+            "stopped_by": stopped_by,
+            "time": time.time() - start,
+        }
+        return value, vector, info
+
+    def configuration(self):
+        # settings recorded in the info of the eigenpairs computed by this solver
+        return {"eigensolver": self.method, "tol": self.tol, "maxiter": self.maxiter, "time_budget": self.time_budget}
+
+    def accepts(self, info):
+        # whether an eigenpair computed earlier (described by info) can be used: always if this solver configuration
+        # computed it (running it again would give the same pair), otherwise only if its residual is small enough
+        if all(info.get(key) == value for key, value in self.configuration().items()):
+            return True
+        return info.get("residual", np.inf) <= max(self.tol, 1e-8)
+
+    def arpack(self, a, v0, deadline, rng):
+        operator = RecordingOperator(a, deadline)
+        try:
+            values, vectors = eigsh(operator, k=1, which='LA', v0=v0, tol=self.tol, maxiter=self.maxiter)
+            return values[0], vectors[:, 0], operator.products, 'convergence'
+        except ArpackNoConvergence as error:
+            stopped_by = 'maxiter'
+            if len(error.eigenvalues) > 0:
+                return error.eigenvalues[-1], error.eigenvectors[:, -1], operator.products, stopped_by
+        except TimeBudgetExceeded:
+            stopped_by = 'time_budget'
+        value, vector, _ = operator.best_recorded_pair()
+        return value, vector, operator.products, stopped_by
+
+    def lobpcg(self, a, v0, deadline, rng):
+        operator = RecordingOperator(a, deadline)
+        x = self.initial_block(a.shape[0], v0, rng)
+        try:
+            # lobpcg returns its last iterate when maxiter is reached, and only warns that the tolerance was not met
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                values, vectors = lobpcg(operator, x, tol=self.tol or None, maxiter=self.maxiter or 100, largest=True)
+            converged = not any('not reaching the requested tolerance' in str(warning.message) for warning in caught)
+            stopped_by = 'convergence' if converged else 'maxiter'
+            value, vector = values[0], vectors[:, 0]
+        except TimeBudgetExceeded:
+            stopped_by = 'time_budget'
+            value, vector, _ = operator.best_recorded_pair()
+        return value, vector, operator.products, stopped_by
+
+    def power(self, a, v0, deadline, rng):
+        # block power iteration: the block converges to the eigenvectors of largest magnitude, and the Rayleigh-Ritz
+        # step picks the largest algebraic one among them (negative eigenvalues may dominate in magnitude)
+        return self.subspace_iteration(a, self.initial_block(a.shape[0], v0, rng), deadline, self.maxiter or 1000)
+
+    def randomized(self, a, v0, deadline, rng):
+        # randomized range finder: a few power steps on an oversampled Gaussian block
+        x = self.initial_block(a.shape[0], v0, rng, self.block_size + 10)
+        return self.subspace_iteration(a, x, deadline, self.maxiter or 4)
+
+    def initial_block(self, n, v0, rng, block_size=None):
+        x = rng.standard_normal((n, min(block_size or self.block_size, n)))
+        if v0 is not None:
+            x[:, 0] = v0
+        return x
+
+    def subspace_iteration(self, a, x, deadline, maxiter):
+        tol = self.tol or 1e-8
+        stopped_by = 'maxiter'
+        q, _ = qr(x, mode='economic')
+        iteration = 0
+        while True:
+            a_q = a.dot(q)
+            iteration += 1
+            value, vector, a_vector = rayleigh_ritz(q, a_q)
+            if relative_residual(value, vector, a_vector) <= tol:
+                stopped_by = 'convergence'
+                break
+            if iteration >= maxiter:
+                break
+            if deadline is not None and time.time() > deadline:
+                stopped_by = 'time_budget'
+                break
+            q, _ = qr(a_q, mode='economic')
+        return value, vector, iteration * q.shape[1], stopped_by
+
+
+# solver used by the algorithms (see get_maximum_eigenpair in commons)
+default_eigensolver = EigenSolver()
+
+
+def set_default_eigensolver(eigensolver):
+    global default_eigensolver
+    default_eigensolver = eigensolver
+
+
+def get_default_eigensolver():
+    return default_eigensolver
@@ -0,0 +1,142 @@
+import warnings
+warnings.filterwarnings("ignore", message="numpy.dtype size changed")
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import multiprocessing.connection
+import resource
+import time
+import traceback
+from typing import Any, Dict, List
+
+from main import NON_SPECTRAL_ALGORITHMS, build_parser, configure, get_relevant_parameters, run_algorithm, save_results
+from algorithms.subroutines.commons import get_maximum_eigenpair
+from signed_graph.signed_graph import SignedGraph
+from signed_graph.shared_graph import attach_signed_graph
+
+
+def load_grid(grid_file: str) -> List[argparse.Namespace]:
+    # one namespace of main.py arguments per job: the cartesian product of the datasets, the algorithms and every
+    # list-valued setting of the grid (scalar settings apply to all the jobs); jobs with the same relevant parameters
+    # (e.g. different T for greedy2PC) are run once
+    with open(grid_file, "r") as f:
+        grid = json.load(f)
+
+    parser = build_parser()
+    datasets = grid.pop("datasets")
+    algorithms = grid.pop("algorithms")
+    unknown = set(grid) - {action.dest for action in parser._actions}
+    if unknown:
+        raise ValueError('unknown settings in the grid: {}'.format(', '.join(sorted(unknown))))
+    axes = {key: value if isinstance(value, list) else [value] for key, value in grid.items()}
+
+    jobs = []
+    seen = set()
+    for dataset, algorithm, values in itertools.product(datasets, algorithms, itertools.product(*axes.values())):
+        args = parser.parse_args([dataset, algorithm])
+        for key, value in zip(axes, values):
+            setattr(args, key, value)
+        if "verbosity" not in axes:
+            args.verbosity = 'silent'
+
+        try:
+            parameters = json.dumps(get_relevant_parameters(algorithm, args), sort_keys=True)
+        except KeyError:
+            raise ValueError('unknown algorithm {}'.format(algorithm))
+        if (dataset, algorithm, parameters) not in seen:
+            seen.add((dataset, algorithm, parameters))
+            jobs.append(args)
+
+    return jobs
+
+def run_job(descriptor: Dict[str, Any], args: argparse.Namespace, memory_limit, connection):
+    # executed in the job process: attach the shared graph, run the algorithm and send back (status, payload)
+    try:
+        configure(args)
+        signed_graph = attach_signed_graph(descriptor)
+
+        # the limit is set after attaching (a failed attach would destroy the shared blocks of all the jobs)
+        if memory_limit is not None:
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit * 2 ** 20, memory_limit * 2 ** 20))
+        connection.send(("done", run_algorithm(signed_graph, args)))
+    except MemoryError:
+        connection.send(("memory", "memory limit of {} MB exceeded".format(memory_limit)))
+    except Exception:
+        connection.send(("error", traceback.format_exc()))
+    finally:
+        connection.close()
+
+def run_dataset(dataset: str, jobs: List[argparse.Namespace], processes: int, timeout, memory_limit, report):
+    # load the graph (and its leading eigenpair) once, and run its jobs on at most processes job processes at a time
+    configure(jobs[0])
+    signed_graph = SignedGraph(dataset, use_cache=not jobs[0].no_cache, parse_workers=jobs[0].parse_workers, persist_eigenpair=jobs[0].persist_eigenpair)
+    # (no need to compute the leading eigenpair before forking the jobs if none of them uses it)
+    if any(args.a not in NON_SPECTRAL_ALGORITHMS for args in jobs):
+        get_maximum_eigenpair(signed_graph)
+
+    with signed_graph.share() as shared_graph:
+        pending = list(jobs)
+        running = {}
+        try:
+            while pending or running:
+                # start new jobs
+                while pending and len(running) < processes:
+                    args = pending.pop(0)
+                    receiver, sender = multiprocessing.Pipe(duplex=False)
+                    process = multiprocessing.Process(target=run_job, args=(shared_graph.descriptor, args, memory_limit, sender))
+                    process.start()
+                    sender.close()
+                    running[receiver] = (process, args, time.time())
+
+                # collect the finished jobs
+                for receiver in multiprocessing.connection.wait(list(running), timeout=1):
+                    process, args, start = running.pop(receiver)
+                    try:
+                        status, payload = receiver.recv()
+                    except EOFError:
+                        status, payload = "crashed", None
+                    process.join()
+                    if status == "crashed":
+                        payload = "job process exited with code {}".format(process.exitcode)
+                    report(args, status, payload, time.time() - start)
+
+                # stop the jobs over time
+                for receiver, (process, args, start) in list(running.items()):
+                    if timeout is not None and time.time() - start > timeout:
+                        process.terminate()
+                        process.join()
+                        del running[receiver]
+                        report(args, "timeout", "time limit of {} seconds exceeded".format(timeout), time.time() - start)
+        finally:
+            for process, _, _ in running.values():
+                process.terminate()
+                process.join()
+
+if __name__ == '__main__':
+    # create a parser
+    parser = argparse.ArgumentParser(description='Run a grid of experiments (datasets x algorithms x parameters)')
+    parser.add_argument('grid', help='JSON grid: {"datasets": [...], "algorithms": [...], <main.py setting>: value or [values], ...}', type=str)
+    parser.add_argument('-j', '--jobs', help='number of jobs running at the same time', type=int, default=1)
+    parser.add_argument('--timeout', help='wall-clock limit of each job in seconds', type=float, default=None)
+    parser.add_argument('--memory', help='address space limit of each job in MB', type=int, default=None)
+    batch_args = parser.parse_args()
+
+    jobs = load_grid(batch_args.grid)
+    counts = {}
+
+    def report(args, status, payload, elapsed):
+        # results are saved as soon as each job finishes
+        counts[status] = counts.get(status, 0) + 1
+        print('[{}/{}] {} {} {}: {} ({:.1f}s)'.format(sum(counts.values()), len(jobs), args.d, args.a, json.dumps(get_relevant_parameters(args.a, args)), status, elapsed))
+        if status == "done":
+            save_results(args.d, args.a, payload, save_json=args.save_json)
+        else:
+            print(payload)
+
+    # group the jobs by dataset, so that each graph is loaded once
+    for dataset, dataset_jobs in itertools.groupby(sorted(jobs, key=lambda args: args.d), key=lambda args: args.d):
+        run_dataset(dataset, list(dataset_jobs), batch_args.jobs, batch_args.timeout, batch_args.memory, report)
+
+    print('Jobs: ' + ', '.join('{} {}'.format(count, status) for status, count in counts.items()))
@@ -3,14 +3,14 @@ warnings.filterwarnings("ignore", message="numpy.dtype size changed")
 
 import argparse
 import numpy as np
-import json
 import time
 import os
 from typing import Dict, Any, List, Tuple
 from algorithms.subroutines import commons
-from algorithms.subroutines.commons import build_solution_two_sets
+from algorithms.subroutines.eigensolvers import EIGENSOLVER_METHODS, EigenSolver, set_default_eigensolver
 
 from signed_graph.signed_graph import SignedGraph
+from signed_graph.threaded_spmv import set_number_of_threads
 
 from algorithms.eigensign import eigensign
 from algorithms.eigensign import eigensign_binary
@@ -22,136 +22,298 @@ from algorithms.local_search import local_search
 from algorithms.greedy_degree_removal import greedy_degree_removal
 from algorithms.greedy2PC import greedy2PC
 from algorithms.greedy2PC import greedy2PC_plus_plus
+from algorithms.greedy2PC import greedy2PC_batch
+from algorithms.greedy2PC import greedy2PC_multi_start
+from algorithms.graph_context import GraphContext
 
-from utilities.print_console import print_input
+from utilities.print_console import VERBOSITY_LEVELS, logger, print_end_algorithm, print_input, set_verbosity
+from utilities.results_store import DEFAULT_STORE, ResultsStore, save_solution
+from utilities.run_cache import RunCache
 
 from datetime import datetime
 
-def save_results(dataset: str, algorithm: str, results: Dict[str, Any]):
-    output_dir = os.path.join("output", dataset)
-    os.makedirs(output_dir, exist_ok=True)
-    output_file = os.path.join(output_dir, f"{algorithm}_results.json")
-    
+# algorithms available from the command line
+ALGORITHMS = ('eigensign', 'eigensign-binary', 'random_eigensign', 'bansal', 'random_local', 'greedy', 'greedy2PC', 'greedy2PC++', 'greedy2PC-batch')
+
+# algorithms that never use the leading eigenvector
+NON_SPECTRAL_ALGORITHMS = ('bansal',)
+
+def save_results(dataset: str, algorithm: str, results: Dict[str, Any], save_json: bool = False):
     # Add timestamp to results in a human-readable format
     results["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    # Load existing results if file exists
-    if os.path.exists(output_file):
-        with open(output_file, "r") as f:
-            existing_results = json.load(f)
-    else:
-        existing_results = []
-    
-    # Check if an entry with the same parameters already exists
-    updated = False
-    for i, entry in enumerate(existing_results):
-        if isinstance(entry, dict) and entry.get("parameters") == results.get("parameters"):
-            existing_results[i] = results
-            updated = True
-            break
-    
-    # If no matching entry was found, append the new results
-    if not updated:
-        existing_results.append(results)
-    
-    # Save the updated results
-    with open(output_file, "w") as f:
-        json.dump(existing_results, f, indent=2, separators=(',', ': '))
-    
-    print(f"Results saved to {output_file}")
 
-def format_results(signed_graph, xs: List[np.ndarray], running_time: float) -> Dict[str, Any]:
+    # Insert the results, or replace the entry with the same parameters
+    with ResultsStore() as store:
+        store.save(dataset, algorithm, results)
+        logger.info("Results saved to %s", DEFAULT_STORE)
+
+        # Rebuild the JSON file of the dataset and algorithm from the store
+        if save_json:
+            store.export_json(dataset=dataset, algorithm=algorithm)
+            logger.info("Results exported to %s", os.path.join("output", dataset, f"{algorithm}_results.json"))
+
+def format_results(x: np.ndarray, metrics: Dict[str, Any], running_time: float) -> Dict[str, Any]:
+    # the communities are stored in a compressed sidecar file, referenced by the results
     return {
-        "solutions": [{"S1": list(S1), "S2": list(S2)} for x in xs for S1, S2 in [build_solution_two_sets(x)]],
-        "polarity_scores": [commons.evaluate_objective_function(signed_graph, x) for x in xs],
-        "agreement_ratios": [commons.compute_agreement_ratio(signed_graph, x) for x in xs],
+        "solutions": [save_solution(x)],
+        "polarity_scores": [float(metrics["polarity"])],
+        "agreement_ratios": [float(metrics["agreement_ratio"])],
+        "edge_counts": [{name: int(metrics[name]) for name in commons.SOLUTION_METRICS if name.startswith(('internal', 'cross', 'cut'))}],
         "running_time": running_time
     }
 
+def format_trace(trace: Dict[str, np.ndarray]) -> Dict[str, List]:
+    return {"removal_order": trace["removal_order"].tolist(), "density": trace["density"].tolist()}
+
 def get_relevant_parameters(algorithm: str, args: argparse.Namespace) -> Dict[str, Any]:
     
     algorithm_params = {
         "eigensign": {},
         "eigensign-binary": {},
-        "random_eigensign": {"beta": args.b},
+        "random_eigensign": {"beta": args.b, **({"samples": args.samples} if args.samples != 1 else {}), **({"seed": args.seed} if args.seed is not None else {})},
         "bansal": {},
-        "random_local": {"max_iterations": args.lsmi, "convergence_threshold": args.ct},
+        "random_local": {"max_iterations": args.lsmi, "convergence_threshold": args.ct, **({"start": args.lss} if args.lss != 'r' else {})},
         "greedy": {},
         "greedy2PC": {},
-        "greedy2PC++": {"T": args.T, "use_convergence": args.use_convergence},
+        "greedy2PC++": {"T": args.T, "use_convergence": args.use_convergence, **({"gap": args.gap} if args.gap is not None else {})},
+        "greedy2PC-batch": {"epsilon": args.eps},
     }
     
-    return {**algorithm_params[algorithm]}
+    # eigensolver settings are stored only when they differ from the defaults, so that default runs keep matching older entries
+    eigensolver_params = {"eigensolver": args.eigensolver, "eigensolver_tol": args.etol, "eigensolver_maxiter": args.emaxiter, "eigensolver_time_budget": args.etime}
+    eigensolver_defaults = {"eigensolver": "arpack", "eigensolver_tol": 0, "eigensolver_maxiter": None, "eigensolver_time_budget": None}
 
-if __name__ == '__main__':
+    # multi-start settings of greedy2PC and greedy2PC++, when used
+    multi_start_params = {}
+    if algorithm in ("greedy2PC", "greedy2PC++") and (args.multi_start > 1 or args.perturbations > 0):
+        multi_start_params = {"multi_start": args.multi_start, "perturbations": args.perturbations, "perturbation_rate": args.perturbation_rate, "seed": args.seed}
+
+    return {**algorithm_params[algorithm], **multi_start_params, **{key: value for key, value in eigensolver_params.items() if value != eigensolver_defaults[key]}}
+
+def is_deterministic(algorithm: str, args: argparse.Namespace) -> bool:
+    # runs that give the same solution every time (only these are memoized)
+    if algorithm == 'random_eigensign' or (algorithm in ('greedy2PC', 'greedy2PC++') and args.perturbations > 0):
+        return args.seed is not None
+    if algorithm == 'random_local':
+        return args.lss != 'r'
+    return True
+
+def build_parser() -> argparse.ArgumentParser:
     # create a parser
     parser = argparse.ArgumentParser(description='Algorithms for the 2PC problem')
 
-    # create and read the arguments
+    # create the arguments
     parser.add_argument('d', help='dataset', type=str)
-    parser.add_argument('a', help='algorithm', type=str)
-    parser.add_argument('-p', '--print_results', help='print results inside each method', action='store_true', default=True)
+    parser.add_argument('a', help="algorithm, comma-separated algorithms or 'all'", type=str)
+    parser.add_argument('-v', '--verbosity', help='console output: nothing, metrics and community sizes, or also the nodes of the communities (written to output/<dataset>/<algorithm>_communities.txt)', choices=VERBOSITY_LEVELS, default='summary')
+    parser.add_argument('-p', '--print_results', help='same as --verbosity full', dest='verbosity', action='store_const', const='full')
+    parser.add_argument('-q', '--quiet', help='same as --verbosity silent', dest='verbosity', action='store_const', const='silent')
     parser.add_argument('-T', help='number of iterations (for greedy++)', type=int, default=10)
     parser.add_argument('-uc', '--use_convergence', help='use convergence check (for greedy++)', action='store_true', default=False)
-    parser.add_argument('-lsmi', help='maximum iterations for local search', type=int, default=10)
+    parser.add_argument('-gap', '--gap', help="stop when the best polarity is within this relative gap from the bound of the starting sign pattern (for greedy++)", type=float, default=None)
+    parser.add_argument('-lsmi', help='maximum moves for local search (0: until convergence)', type=int, default=10)
+    parser.add_argument('-lss', help='starting solution for local search: random (r), bansal (b) or greedy2PC (g)', choices=('r', 'b', 'g'), default='r')
     parser.add_argument('-ct', help='convergence threshold', type=float, default=0.2)
     parser.add_argument('-b', help='multiplicative factor for random_eigensign', type=str, default='l1')
+    parser.add_argument('-ms', '--multi_start', help='number of top eigenvectors whose sign patterns start the peeling (for greedy2PC and greedy2PC++)', type=int, default=1)
+    parser.add_argument('-mp', '--perturbations', help='random perturbations of each starting sign pattern (for greedy2PC and greedy2PC++)', type=int, default=0)
+    parser.add_argument('-mpr', '--perturbation_rate', help='probability of flipping each sign in a perturbation', type=float, default=0.05)
+    parser.add_argument('-k', '--samples', help='number of roundings drawn (for random_eigensign)', type=int, default=1)
+    parser.add_argument('--seed', help='seed of the random streams (for random_eigensign and the multi-start perturbations)', type=int, default=None)
+    parser.add_argument('-eps', help='threshold slack of each peeling round (for greedy2PC-batch)', type=float, default=0.1)
+    parser.add_argument('-es', '--eigensolver', help='method computing the leading eigenvector', choices=EIGENSOLVER_METHODS, default='arpack')
+    parser.add_argument('-etol', help='relative residual tolerance of the eigensolver (0: solver default)', type=float, default=0)
+    parser.add_argument('-emaxiter', help='maximum iterations of the eigensolver', type=int, default=None)
+    parser.add_argument('-etime', help='wall-clock budget of the eigensolver in seconds', type=float, default=None)
+    parser.add_argument('-st', '--save_trace', help='store the removal order and density after each removal (for the peeling algorithms)', action='store_true', default=False)
+    parser.add_argument('-sj', '--save_json', help='also rewrite output/<dataset>/<algorithm>_results.json from the results store', action='store_true', default=False)
+    parser.add_argument('-m', '--memoize', help='reuse the results of an identical earlier run (same graph, parameters and code)', action='store_true', default=False)
+    parser.add_argument('--force', help='run the algorithms even if memoized results exist (and memoize the new ones)', action='store_true', default=False)
+    parser.add_argument('--cache_max_age', help='evict memoized runs unused for this many days', type=float, default=None)
+    parser.add_argument('--cache_max_entries', help='keep at most this many memoized runs (least recently used first out)', type=int, default=None)
+    parser.add_argument('--debug', help='cross-check incremental computations against full evaluations', action='store_true', default=False)
+    parser.add_argument('-nc', '--no_cache', help='do not read or write the compiled graph cache', action='store_true', default=False)
+    parser.add_argument('-pe', '--persist_eigenpair', help='store the leading eigenpair next to the compiled graph cache and reuse it in later runs', action='store_true', default=False)
+    parser.add_argument('-pw', '--parse_workers', help='number of processes parsing the edge list', type=int, default=1)
+    parser.add_argument('-w', '--workers', help='number of workers (processes for bansal and multi-start, threads for random_eigensign)', type=int, default=1)
+    parser.add_argument('-th', '--threads', help='number of threads of the sparse matrix-vector products', type=int, default=1)
 
-    args = parser.parse_args()
+    return parser
 
-    # read the input graph
-    signed_graph = SignedGraph(args.d)
-    print_input(args.d, signed_graph.number_of_nodes, signed_graph.number_of_edges, args.a)
+def configure(args: argparse.Namespace):
+    # configure the sparse products and the eigensolver shared by all the spectral algorithms
+    set_number_of_threads(args.threads)
+    set_verbosity(args.verbosity)
+    set_default_eigensolver(EigenSolver(args.eigensolver, tol=args.etol, maxiter=args.emaxiter, time_budget=args.etime))
 
-    # execute the algorithm and save results
+def execute_algorithm(context: GraphContext, algorithm: str, args: argparse.Namespace) -> Tuple[np.ndarray, Dict[str, Any], float]:
+    # execute the algorithm: solution vector, algorithm-specific results and running time (the algorithms print
+    # nothing, run_algorithms prints their results once they are evaluated)
+    signed_graph = context.signed_graph
+    extras = {}
     start_time = time.time()
     
-    if args.a == 'eigensign':
-        _, x = eigensign(signed_graph, print_results=args.print_results)
-        results = format_results(signed_graph, [x], time.time() - start_time)
+    if algorithm == 'eigensign':
+        _, x, threshold = eigensign(signed_graph, print_results=False, return_threshold=True)
+        extras["threshold"] = float(threshold)
     
-    elif args.a == 'eigensign-binary':
-        _, x, _ = eigensign_binary(signed_graph, print_results=args.print_results)
-        results = format_results(signed_graph, [x], time.time() - start_time)
-
-    elif args.a == 'random_eigensign':
-        _, x, maximum_eigenvector, execution_time_seconds, beta = random_eigensign(signed_graph, args.b, print_results=args.print_results)
-        results = format_results(signed_graph, [x], time.time() - start_time)
-        results["beta"] = beta
-
-    elif args.a == 'bansal':
-        _, x = bansal(signed_graph, print_results=args.print_results)
-        results = format_results(signed_graph, [x], time.time() - start_time)
-
-    elif args.a == 'random_local':
-        _, x = local_search(signed_graph, args.mi, args.ct, print_results=args.print_results)
-        results = format_results(signed_graph, [x], time.time() - start_time)
-
-    elif args.a == 'greedy':
-        _, x = greedy_degree_removal(signed_graph, print_results=args.print_results)
-        results = format_results(signed_graph, [x], time.time() - start_time)
-    
-    elif args.a == 'greedy2PC':
-        _, eigensign_binary_solution, _ = eigensign_binary(signed_graph, print_results=False)
-        _, x, maximum_inconsistent_degree = greedy2PC(signed_graph, eigensign_binary_solution, print_results=args.print_results)
-        results = format_results(signed_graph, [x], time.time() - start_time)
-        results["maximum_inconsistent_degree"] = maximum_inconsistent_degree
+    elif algorithm == 'eigensign-binary':
+        _, x, _ = eigensign_binary(signed_graph, print_results=False)
+
+    elif algorithm == 'random_eigensign':
+        _, x, maximum_eigenvector, execution_time_seconds, beta = random_eigensign(signed_graph, args.b, print_results=False, samples=args.samples, seed=args.seed, workers=args.workers)
+        extras["beta"] = beta
+
+    elif algorithm == 'bansal':
+        _, x = bansal(signed_graph, print_results=False, workers=args.workers)
+
+    elif algorithm == 'random_local':
+        _, x = local_search(signed_graph, args.lsmi if args.lsmi > 0 else None, args.ct, partial_solution=args.lss, print_results=False)
+
+    elif algorithm == 'greedy':
+        _, x, *trace = greedy_degree_removal(signed_graph, print_results=False, debug=args.debug, return_trace=args.save_trace)
+        if args.save_trace:
+            extras["trace"] = format_trace(trace[0])
     
+    elif algorithm in ('greedy2PC', 'greedy2PC++') and (args.multi_start > 1 or args.perturbations > 0):
+        options = {"use_convergence": args.use_convergence, "gap": args.gap} if algorithm == 'greedy2PC++' else {}
+        _, x, maximum_inconsistent_degree, starts = greedy2PC_multi_start(
+            signed_graph,
+            args.multi_start,
+            args.perturbations,
+            args.perturbation_rate,
+            T=args.T if algorithm == 'greedy2PC++' else None,
+            workers=args.workers,
+            seed=args.seed,
+            print_results=False,
+            **options
+        )
+        extras["maximum_inconsistent_degree"] = maximum_inconsistent_degree
+        extras["starts"] = starts
+
+    elif algorithm == 'greedy2PC':
+        _, x, maximum_inconsistent_degree, *trace = greedy2PC(signed_graph, context.get_eigensign_binary_solution(), print_results=False, return_trace=args.save_trace, eigensign_degrees=context.get_eigensign_degrees())
+        extras["maximum_inconsistent_degree"] = maximum_inconsistent_degree
+        if args.save_trace:
+            extras["trace"] = format_trace(trace[0])
     
-    elif args.a == 'greedy2PC++':
-        _, eigensign_binary_solution, _ = eigensign_binary(signed_graph, print_results=args.print_results)
-        _, x, maximum_inconsistent_degree, n_iterations = greedy2PC_plus_plus(
+    elif algorithm == 'greedy2PC-batch':
+        _, x, maximum_inconsistent_degree, n_rounds = greedy2PC_batch(signed_graph, context.get_eigensign_binary_solution(), args.eps, print_results=False, eigensign_degrees=context.get_eigensign_degrees())
+        extras["maximum_inconsistent_degree"] = maximum_inconsistent_degree
+        extras["rounds"] = n_rounds
+
+    elif algorithm == 'greedy2PC++':
+        _, x, maximum_inconsistent_degree, n_iterations, upper_bound, sign_pattern_bound, *traces = greedy2PC_plus_plus(
             signed_graph, 
-            eigensign_binary_solution, 
+            context.get_eigensign_binary_solution(), 
             args.T, 
             use_convergence=args.use_convergence,
-            print_results=args.print_results
+            gap=args.gap,
+            print_results=False,
+            debug=args.debug,
+            return_trace=args.save_trace,
+            eigensign_degrees=context.get_eigensign_degrees()
         )
-        results = format_results(signed_graph, [x], time.time() - start_time)
-        results["maximum_inconsistent_degree"] = maximum_inconsistent_degree
-        results["iterations"] = n_iterations
+        extras["maximum_inconsistent_degree"] = maximum_inconsistent_degree
+        extras["iterations"] = n_iterations
+        extras["upper_bound"] = upper_bound
+        extras["sign_pattern_bound"] = sign_pattern_bound
+        if args.save_trace:
+            extras["trace"] = [format_trace(trace) for trace in traces[0]]
+
+    else:
+        raise ValueError('unknown algorithm {}'.format(algorithm))
+
+    return x, extras, time.time() - start_time
+
+def print_algorithm_results(signed_graph, algorithm: str, x: np.ndarray, extras: Dict[str, Any], metrics: Dict[str, np.ndarray], running_time: float, args: argparse.Namespace):
+    # console output of an algorithm, from the metrics of its solution
+    if args.verbosity == 'full':
+        # the node listings of each algorithm are streamed to their own file
+        listing_path = os.path.join("output", args.d, f"{algorithm}_communities.txt")
+        os.makedirs(os.path.dirname(listing_path), exist_ok=True)
+        open(listing_path, "w").close()
+        set_verbosity(args.verbosity, listing_path)
+
+    thresholds = [extras["threshold"]] if "threshold" in extras else (["Binary"] if algorithm == 'eigensign-binary' else np.nan)
+    print_end_algorithm(running_time, [x], signed_graph, metrics["polarity"], beta=extras.get("beta", np.nan), thresholds=thresholds, metrics=metrics)
+
+def run_algorithms(context: GraphContext, algorithms: List[str], args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    # execute every algorithm on the shared context (with more than one algorithm, the shared quantities are computed
+    # up front), then evaluate all the solutions at once; memoized runs are reused instead of executed
+    graph_hash = context.signed_graph.get_content_hash()
+    cache = RunCache(max_age=args.cache_max_age * 86400 if args.cache_max_age is not None else None, max_entries=args.cache_max_entries) if args.memoize else None
+
+    all_results = {}
+    if cache is not None and not args.force:
+        for algorithm in algorithms:
+            results = cache.get(graph_hash, algorithm, get_relevant_parameters(algorithm, args)) if is_deterministic(algorithm, args) else None
+            if results is not None:
+                results["memoized"] = True
+                all_results[algorithm] = results
+                logger.info('%s: results of an earlier run reused (polarity %s)', algorithm, results["polarity_scores"][0])
+
+    pending = [algorithm for algorithm in algorithms if algorithm not in all_results]
+    if len(pending) > 1:
+        context.precompute()
+    executions = {algorithm: execute_algorithm(context, algorithm, args) for algorithm in pending}
+    xs = [x for x, _, _ in executions.values()]
+    if xs:
+        metrics = commons.evaluate_solutions(context.signed_graph, np.column_stack(xs))
+
+    for i, (algorithm, (x, extras, running_time)) in enumerate(executions.items()):
+        solution_metrics = {name: values[i:i + 1] for name, values in metrics.items()}
+        if args.verbosity != 'silent':
+            print_algorithm_results(context.signed_graph, algorithm, x, extras, solution_metrics, running_time, args)
+
+        results = format_results(x, {name: values[0] for name, values in solution_metrics.items()}, running_time)
+        results.update(extras)
+        for bound, gap in (("upper_bound", "gap"), ("sign_pattern_bound", "sign_pattern_gap")):
+            if bound in results:
+                results[gap] = (results[bound] - results["polarity_scores"][0]) / abs(results[bound]) if results[bound] != 0 else 0.0
+        if context.precomputation_time:
+            results["shared_precomputation_time"] = context.precomputation_time
 
-    # Add the relevant parameters to the results
-    results["parameters"] = get_relevant_parameters(args.a, args)
+        # Add the graph the algorithm ran on
+        results["graph_hash"] = graph_hash
+
+        # Add the eigensolver that computed the leading eigenvector, if the algorithm used it
+        if algorithm not in NON_SPECTRAL_ALGORITHMS and context.signed_graph.get_eigenpair_info() is not None:
+            results["eigensolver"] = context.signed_graph.get_eigenpair_info()
+
+        # Add the relevant parameters to the results
+        results["parameters"] = get_relevant_parameters(algorithm, args)
+        all_results[algorithm] = results
+
+        if cache is not None and is_deterministic(algorithm, args):
+            cache.put(graph_hash, algorithm, results["parameters"], results)
+
+    if cache is not None:
+        cache.close()
+
+    return {algorithm: all_results[algorithm] for algorithm in algorithms}
+
+def run_algorithm(signed_graph, args: argparse.Namespace) -> Dict[str, Any]:
+    return run_algorithms(GraphContext(signed_graph), [args.a], args)[args.a]
+
+def parse_algorithms(algorithm: str) -> List[str]:
+    # 'all', or one or more comma-separated algorithms
+    algorithms = list(ALGORITHMS) if algorithm == 'all' else algorithm.split(',')
+    for name in algorithms:
+        if name not in ALGORITHMS:
+            raise ValueError('unknown algorithm {} (available: {})'.format(name, ', '.join(ALGORITHMS)))
+    return algorithms
+
+if __name__ == '__main__':
+    # read the arguments
+    args = build_parser().parse_args()
+    configure(args)
+
+    # read the input graph
+    signed_graph = SignedGraph(args.d, use_cache=not args.no_cache, parse_workers=args.parse_workers, persist_eigenpair=args.persist_eigenpair)
+    print_input(args.d, signed_graph.number_of_nodes, signed_graph.number_of_edges, args.a)
 
-    save_results(args.d, args.a, results)
+    # execute the algorithms and save results
+    algorithms = parse_algorithms(args.a)
+    for algorithm, results in run_algorithms(GraphContext(signed_graph), algorithms, args).items():
+        save_results(args.d, algorithm, results, save_json=args.save_json)
@@ -0,0 +1,107 @@
+import bz2
+import gzip
+import lzma
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# openers of the supported (possibly compressed) dataset files
+OPENERS = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+}
+
+# size of the blocks of text parsed at once
+CHUNK_SIZE = 1 << 26
+
+
+def open_dataset(dataset_file):
+    # open the file in binary mode, decompressing it on the fly if needed
+    for extension, opener in OPENERS.items():
+        if dataset_file.endswith(extension):
+            return opener(dataset_file, 'rb')
+    return open(dataset_file, 'rb')
+
+
+def read_chunks(dataset_file, chunk_size=CHUNK_SIZE):
+    # yield blocks of whole lines of the edge list, skipping the header
+    remainder = b''
+    for block in iter(lambda: dataset_file.read(chunk_size), b''):
+        block = remainder + block
+        end = block.rfind(b'\n') + 1
+        if end == 0:
+            remainder = block
+            continue
+        remainder = block[end:]
+        yield block[:end]
+    if remainder.strip():
+        yield remainder
+
+
+def parse_chunk(chunk):
+    # parse the (from, to, sign) triples of a block of lines
+    values = np.fromstring(chunk, dtype=np.int64, sep=' ')
+    if values.size % 3 != 0:
+        raise ValueError('malformed edge list: every line must contain <from node> <to node> <sign>')
+    return values.reshape(-1, 3)
+
+
+def parse_edge_list(dataset_file, workers=1, chunk_size=CHUNK_SIZE):
+    # return the number of nodes and the (from, to, sign) arrays of the edge list
+    with open_dataset(dataset_file) as f:
+        # get the number of nodes from the first line
+        number_of_nodes = int(f.readline().decode().replace('# ', ''))
+
+        # parse the edge list in chunks, in parallel if requested
+        chunks = read_chunks(f, chunk_size)
+        if workers > 1:
+            edges = parse_chunks_in_parallel(chunks, workers)
+        else:
+            edges = [parse_chunk(chunk) for chunk in chunks]
+
+    edges = np.concatenate(edges) if edges else np.empty((0, 3), dtype=np.int64)
+    return number_of_nodes, edges[:, 0], edges[:, 1], edges[:, 2]
+
+
+def parse_chunks_in_parallel(chunks, workers):
+    # parse the chunks on a process pool, reading a chunk only when fewer than 2 * workers are in flight,
+    # so that at most that many chunks of text are held in memory at once
+    edges = []
+    in_flight = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk in chunks:
+            if len(in_flight) >= 2 * workers:
+                edges.append(in_flight.popleft().result())
+            in_flight.append(executor.submit(parse_chunk, chunk))
+        while in_flight:
+            edges.append(in_flight.popleft().result())
+    return edges
+
+
+def compile_csr(number_of_nodes, from_nodes, to_nodes, signs):
+    # build the symmetric CSR arrays (rows sorted by neighbor) from an undirected edge list;
+    # self loops are dropped and, for repeated edges, the last occurrence in the list wins
+    from_nodes = np.asarray(from_nodes, dtype=np.int32)
+    to_nodes = np.asarray(to_nodes, dtype=np.int32)
+    signs = np.where(np.asarray(signs) == 1, 1.0, -1.0)
+
+    keep = from_nodes != to_nodes
+    from_nodes, to_nodes, signs = from_nodes[keep], to_nodes[keep], signs[keep]
+
+    # both directions of every edge, in the order of the edge list
+    rows = np.column_stack((from_nodes, to_nodes)).ravel()
+    columns = np.column_stack((to_nodes, from_nodes)).ravel()
+    data = np.repeat(signs, 2)
+
+    # the sort is stable, so the last copy of a repeated entry is the last of its run
+    order = np.lexsort((columns, rows))
+    rows, columns, data = rows[order], columns[order], data[order]
+    last = np.ones(len(rows), dtype=bool)
+    last[:-1] = (rows[1:] != rows[:-1]) | (columns[1:] != columns[:-1])
+    rows, columns, data = rows[last], columns[last], data[last]
+
+    indptr = np.zeros(number_of_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=number_of_nodes), out=indptr[1:])
+
+    return indptr, columns, data
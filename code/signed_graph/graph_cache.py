@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+# bump when the layout of the cached arrays changes
+CACHE_FORMAT_VERSION = 3
+
+# arrays stored in the cache (one .npy file each)
+CACHE_ARRAYS = ('indptr', 'indices', 'data')
+
+
+def cache_directory(dataset_file):
+    # the cache lives next to the dataset file
+    return dataset_file + '.cache'
+
+
+def file_digest(dataset_file, block_size=1 << 20):
+    # sha1 of the dataset file, read in blocks
+    digest = hashlib.sha1()
+    with open(dataset_file, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_graph_cache(dataset_file):
+    # return (indptr, indices, data, metadata) memory-mapped from the cache, or None if missing or stale
+    directory = cache_directory(dataset_file)
+    metadata_file = os.path.join(directory, 'meta.json')
+    try:
+        with open(metadata_file) as f:
+            metadata = json.load(f)
+        stat = os.stat(dataset_file)
+    except (OSError, ValueError):
+        return None
+
+    if metadata.get('version') != CACHE_FORMAT_VERSION or metadata.get('size') != stat.st_size:
+        return None
+
+    # same size but touched: fall back to the content hash before giving up on the cache
+    if metadata.get('mtime_ns') != stat.st_mtime_ns:
+        if metadata.get('sha1') != file_digest(dataset_file):
+            return None
+        metadata['mtime_ns'] = stat.st_mtime_ns
+        try:
+            write_metadata(directory, metadata)
+        except OSError:
+            pass
+
+    try:
+        arrays = [np.load(os.path.join(directory, name + '.npy'), mmap_mode='r') for name in CACHE_ARRAYS]
+    except (OSError, ValueError):
+        return None
+
+    return (*arrays, metadata)
+
+
+def save_graph_cache(dataset_file, indptr, indices, data, number_of_nodes, number_of_edges):
+    # compile the CSR arrays to disk; failures (e.g. read-only datasets directory) only disable caching
+    directory = cache_directory(dataset_file)
+    try:
+        stat = os.stat(dataset_file)
+        os.makedirs(directory, exist_ok=True)
+
+        # write every array to a private file first and then rename it, so that concurrent readers never see partial files
+        for name, array in zip(CACHE_ARRAYS, (indptr, indices, data)):
+            temporary_file = os.path.join(directory, '{}.{}.tmp.npy'.format(name, os.getpid()))
+            np.save(temporary_file, np.ascontiguousarray(array))
+            os.replace(temporary_file, os.path.join(directory, name + '.npy'))
+
+        # the metadata is written last and marks the cache as complete
+        write_metadata(directory, {
+            'version': CACHE_FORMAT_VERSION,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha1': file_digest(dataset_file),
+            'number_of_nodes': int(number_of_nodes),
+            'number_of_edges': int(number_of_edges),
+        })
+    except OSError:
+        return False
+
+    return True
+
+
+def write_metadata(directory, metadata):
+    temporary_file = os.path.join(directory, 'meta.{}.tmp.json'.format(os.getpid()))
+    with open(temporary_file, 'w') as f:
+        json.dump(metadata, f)
+    os.replace(temporary_file, os.path.join(directory, 'meta.json'))
+
+
+
+def eigenpair_file(directory, content_hash):
+    return os.path.join(directory, 'eigenpair-{}.npz'.format(content_hash))
+
+
+def load_eigenpair(directory, content_hash):
+    # return the (value, vector, info) stored for the graph content, or None
+    try:
+        with np.load(eigenpair_file(directory, content_hash)) as eigenpair:
+            return float(eigenpair['value']), eigenpair['vector'], json.loads(str(eigenpair['info']))
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def load_latest_eigenvector(directory, size):
+    # most recently stored eigenvector of the given size (e.g. of a previous version of the dataset), or None
+    try:
+        files = [os.path.join(directory, name) for name in os.listdir(directory) if name.startswith('eigenpair-') and name.endswith('.npz')]
+    except OSError:
+        return None
+    for file in sorted(files, key=os.path.getmtime, reverse=True):
+        try:
+            with np.load(file) as eigenpair:
+                if len(eigenpair['vector']) == size:
+                    return eigenpair['vector']
+        except (OSError, ValueError, KeyError):
+            continue
+    return None
+
+
+def save_eigenpair(directory, content_hash, value, vector, info):
+    try:
+        os.makedirs(directory, exist_ok=True)
+        temporary_file = os.path.join(directory, 'eigenpair.{}.tmp.npz'.format(os.getpid()))
+        np.savez(temporary_file, value=value, vector=vector, info=json.dumps(info))
+        os.replace(temporary_file, eigenpair_file(directory, content_hash))
+    except OSError:
+        return False
+    return True
@@ -0,0 +1,71 @@
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+
+# arrays of a signed graph published in shared memory
+SHARED_ARRAYS = ('indptr', 'indices', 'data')
+
+
+class SharedSignedGraph:
+    # copies the CSR arrays (and the cached eigenvector) of a signed graph into shared memory blocks, once;
+    # the descriptor is small and picklable, and attach_signed_graph(descriptor) rebuilds the graph over the
+    # blocks in another process without copying. Use it as a context manager: the blocks are released on exit
+
+    def __init__(self, signed_graph):
+        arrays = {name: np.asarray(getattr(signed_graph, name)) for name in SHARED_ARRAYS}
+        if signed_graph.eigenpair is not None and signed_graph.eigenpair[0] == signed_graph.get_content_hash():
+            arrays['eigenvector'] = signed_graph.eigenpair[2]
+
+        self.blocks = []
+        self.descriptor = {
+            "arrays": {},
+            "content_hash": signed_graph.get_content_hash(),
+            "eigenpair": (signed_graph.eigenpair[1], signed_graph.eigenpair[3]) if 'eigenvector' in arrays else None,
+            "dataset_path": getattr(signed_graph, 'dataset_path', None),
+        }
+        try:
+            for name, array in arrays.items():
+                # SharedMemory does not accept empty blocks
+                block = SharedMemory(create=True, size=max(array.nbytes, 1))
+                self.blocks.append(block)
+                np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+                self.descriptor["arrays"][name] = (block.name, array.shape, array.dtype.str)
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        # release and destroy the blocks (the graphs attached to them must not be used afterwards)
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+def attach_signed_graph(descriptor):
+    # signed graph over the shared memory blocks of a descriptor (the arrays are read-only views, not copies);
+    # the blocks stay mapped as long as the graph is alive, so keep the graph rather than arrays or matrices built from it
+    from signed_graph.signed_graph import SignedGraph
+
+    blocks = {}
+    arrays = {}
+    for name, (block_name, shape, dtype) in descriptor["arrays"].items():
+        blocks[name] = SharedMemory(name=block_name)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=blocks[name].buf)
+        arrays[name].flags.writeable = False
+
+    signed_graph = SignedGraph(csr=(arrays['indptr'], arrays['indices'], arrays['data']))
+    signed_graph.shared_blocks = blocks
+    signed_graph.content_hash = descriptor["content_hash"]
+    if descriptor["dataset_path"] is not None:
+        signed_graph.dataset_path = descriptor["dataset_path"]
+    if descriptor["eigenpair"] is not None:
+        value, info = descriptor["eigenpair"]
+        signed_graph.eigenpair = (descriptor["content_hash"], value, arrays['eigenvector'], info)
+
+    return signed_graph
@@ -1,136 +1,229 @@
-from array import array
-from os import curdir
 from scipy.sparse import *
+import numpy as np
+from signed_graph.graph_cache import load_graph_cache, save_graph_cache, cache_directory
+from signed_graph.graph_cache import load_eigenpair, load_latest_eigenvector, save_eigenpair
+from signed_graph.edge_list_parser import OPENERS, parse_edge_list, compile_csr
+from signed_graph.threaded_spmv import ThreadedSpMV, get_number_of_threads
+from signed_graph.shared_graph import SharedSignedGraph
 import gc
+import hashlib
 import os
 
 
 class SignedGraph:
 
-    def __init__(self, dataset_path=None, edge_list=None, number_of_nodes=None):
+    def __init__(self, dataset_path=None, edge_list=None, number_of_nodes=None, use_cache=True, parse_workers=1, persist_eigenpair=False, csr=None):
         # nodes
         self.number_of_nodes = 0
         self.number_of_edges = 0
         self.nodes_iterator = range(0)
 
-        # adjacency list
-        self.adjacency_list = []
+        # CSR arrays of the signed adjacency, the single representation of the graph
+        # (memory-mapped when read from the compiled cache)
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.data = np.zeros(0, dtype='d')
 
-        # adjacency matrix and laplacian
+        # adjacency matrix (signed and unsigned) and laplacian
         self.a = None
+        self.unsigned_a = None
         self.l = None
 
+        # row-partitioned operators of the adjacency matrices, for multithreaded products
+        self.a_operator = None
+        self.unsigned_a_operator = None
+
+        # hash of the graph content and cached leading eigenpair of the adjacency matrix (content hash, value, vector, solver info)
+        self.content_hash = None
+        self.eigenpair = None
+
+        # directory where eigenpairs are stored across runs (None: memory only)
+        self.eigenpair_directory = None
+
         if dataset_path:
             # load the dataset from file
-            self.load_dataset(dataset_path)
+            self.load_dataset(dataset_path, use_cache=use_cache, parse_workers=parse_workers)
             self.dataset_path = dataset_path
+            if persist_eigenpair:
+                self.eigenpair_directory = cache_directory(find_dataset_file(dataset_path))
         elif edge_list is not None and number_of_nodes is not None:
             # build from edge list
-            self.number_of_nodes = number_of_nodes
-            self.nodes_iterator = range(self.number_of_nodes)
-            self.adjacency_list = [[array('i'), array('i')] for _ in self.nodes_iterator]
-            for u, v, sign in edge_list:
-                self.add_edge(u, v, sign)
-                self.number_of_edges += 1
+            edges = np.array(edge_list, dtype=np.int64).reshape(-1, 3)
+            self.load_csr(*compile_csr(number_of_nodes, edges[:, 0], edges[:, 1], edges[:, 2]))
+        elif csr is not None:
+            # wrap existing CSR arrays (indptr, indices, data) without copying them
+            self.load_csr(*csr)
         else:
-            raise ValueError("Either dataset_path or both edge_list and number_of_nodes must be provided")
+            raise ValueError("Either dataset_path, both edge_list and number_of_nodes, or csr must be provided")
 
         # call the garbage collector
         gc.collect()
 
-    def load_dataset(self, dataset_path):
-        # open the file
-        try:
-            dataset_file = open('./datasets/' + dataset_path + '.txt')
-        except IOError:
-            print(os.getcwd())
-            dataset_file = open('../../datasets/' + dataset_path + '.txt')
+    def load_dataset(self, dataset_path, use_cache=True, parse_workers=1):
+        dataset_file = find_dataset_file(dataset_path)
 
-        # get the number of nodes from the first line
-        self.number_of_nodes = int(dataset_file.readline().replace('# ', ''))
+        # open the compiled cache if it is still valid
+        cache = load_graph_cache(dataset_file) if use_cache else None
+        if cache is not None:
+            indptr, indices, data, _ = cache
+        else:
+            # parse the edge list and build the adjacency in bulk (no self loops, no repeated edges)
+            number_of_nodes, from_nodes, to_nodes, signs = parse_edge_list(dataset_file, workers=parse_workers)
+            indptr, indices, data = compile_csr(number_of_nodes, from_nodes, to_nodes, signs)
+            if use_cache:
+                save_graph_cache(dataset_file, indptr, indices, data, number_of_nodes, len(indices) // 2)
+
+        self.load_csr(indptr, indices, data)
+
+    def load_csr(self, indptr, indices, data):
+        self.indptr, self.indices, self.data = indptr, indices, data
+        self.number_of_nodes = len(indptr) - 1
+        self.number_of_edges = len(indices) // 2
         self.nodes_iterator = range(self.number_of_nodes)
 
-        # create the empty adjacency list
-        self.adjacency_list = [[array('i'), array('i')] for _ in self.nodes_iterator]
+        # drop the matrices built from previous arrays (the eigenpair is kept as a warm start)
+        self.a = None
+        self.unsigned_a = None
+        self.l = None
+        self.a_operator = None
+        self.unsigned_a_operator = None
+        self.content_hash = None
+
+    def share(self):
+        # publish the graph in shared memory for worker processes (see SharedSignedGraph)
+        return SharedSignedGraph(self)
+
+    def get_content_hash(self):
+        if self.content_hash is None:
+            # sha1 of the CSR arrays
+            digest = hashlib.sha1()
+            for array in (self.indptr.astype(np.int64, copy=False), self.indices.astype(np.int32, copy=False), self.data.astype('d', copy=False)):
+                digest.update(np.ascontiguousarray(array))
+            self.content_hash = digest.hexdigest()
+
+        return self.content_hash
+
+    def get_leading_eigenpair(self, solver):
+        # leading eigenvalue and eigenvector of the adjacency matrix, computed by solver(a, v0) -> (value, vector, info)
+        # once per graph content, unless solver.accepts(info) rejects the cached one as too inaccurate;
+        # the vector is shared by all the callers, so it is read-only
+        content_hash = self.get_content_hash()
+        if self.eigenpair is not None and self.eigenpair[0] == content_hash and solver.accepts(self.eigenpair[3]):
+            return self.eigenpair[1], self.eigenpair[2]
+
+        eigenpair = load_eigenpair(self.eigenpair_directory, content_hash) if self.eigenpair_directory else None
+        if eigenpair is None or not solver.accepts(eigenpair[2]):
+            # warm start from a less accurate eigenvector or from the eigenvector of a previous version of the graph, if any
+            v0 = None
+            if eigenpair is not None:
+                v0 = eigenpair[1]
+            elif self.eigenpair is not None and len(self.eigenpair[2]) == self.number_of_nodes:
+                v0 = self.eigenpair[2]
+            elif self.eigenpair_directory:
+                v0 = load_latest_eigenvector(self.eigenpair_directory, self.number_of_nodes)
+
+            eigenpair = solver(self.get_adjacency_operator(), v0)
+            if self.eigenpair_directory:
+                save_eigenpair(self.eigenpair_directory, content_hash, *eigenpair)
+
+        value, vector, info = eigenpair
+        vector = np.array(vector, dtype='d')
+        vector.flags.writeable = False
+        self.eigenpair = (content_hash, float(value), vector, info)
+
+        return self.eigenpair[1], self.eigenpair[2]
+
+    def get_eigenpair_info(self):
+        # description of the solver that computed the cached eigenpair (None if it was never computed)
+        return self.eigenpair[3] if self.eigenpair is not None else None
+
+    @property
+    def adjacency_list(self):
+        # compatibility accessor: adjacency_list[node][0] / [1] are the positive / negative neighbors of node
+        return AdjacencyListView(self)
+
+    def get_degrees(self):
+        # number of neighbors of every node
+        return np.diff(self.indptr)
 
-        # fill the adjacency matrix (0: positive neighbors, 1: negative neighbors)
-        for line in dataset_file:
-            split_line = line.split('\t')
-            from_node = int(split_line[0])
-            to_node = int(split_line[1])
-            sign = int(split_line[2])
+    def get_adjacency_matrix(self):
+        if self.a is None:
+            # CSR matrix over the graph arrays: indices and data are shared, while indptr is copied (n + 1 entries)
+            # whenever SciPy narrows it to the int32 index dtype of indices
+            self.a = csr_matrix((self.data, self.indices, self.indptr), shape=(self.number_of_nodes, self.number_of_nodes), copy=False)
 
-            # add the undirected edge
-            self.add_edge(from_node, to_node, sign)
-            self.number_of_edges += 1
+        return self.a
 
-    # add the edge to the adjacency list if it is not a self loop
-    def add_edge(self, from_node, to_node, sign):
-        if sign == 1:
-            sign = 0
-        else:
-            sign = 1
+    def get_unsigned_adjacency_matrix(self):
+        if self.unsigned_a is None:
+            # |A|, sharing the indices of the graph (indptr is narrowed as in get_adjacency_matrix)
+            self.unsigned_a = csr_matrix((np.abs(self.data), self.indices, self.indptr), shape=(self.number_of_nodes, self.number_of_nodes), copy=False)
 
-        if from_node != to_node:
-            self.adjacency_list[from_node][sign].append(to_node)
-            self.adjacency_list[to_node][sign].append(from_node)
+        return self.unsigned_a
 
-    def get_adjacency_matrix(self):
-        if self.a is None:
-            self.a = lil_matrix((self.number_of_nodes, self.number_of_nodes), dtype='d')
+    def get_adjacency_operator(self):
+        # adjacency matrix, or a multithreaded operator over it when more than one thread is configured
+        if get_number_of_threads() <= 1:
+            return self.get_adjacency_matrix()
+        if self.a_operator is None or self.a_operator.threads != get_number_of_threads():
+            self.a_operator = ThreadedSpMV(self.indptr, self.indices, self.data, (self.number_of_nodes, self.number_of_nodes))
 
-            for node, neighbors in enumerate(self.adjacency_list):
-                for neighbor in neighbors[0]:
-                    self.a[node, neighbor] = 1
-                for neighbor in neighbors[1]:
-                    self.a[node, neighbor] = -1
+        return self.a_operator
 
-            self.a = self.a.tocsr()
+    def get_unsigned_adjacency_operator(self):
+        # unsigned adjacency matrix, or a multithreaded operator over it when more than one thread is configured
+        if get_number_of_threads() <= 1:
+            return self.get_unsigned_adjacency_matrix()
+        if self.unsigned_a_operator is None or self.unsigned_a_operator.threads != get_number_of_threads():
+            unsigned_a = self.get_unsigned_adjacency_matrix()
+            self.unsigned_a_operator = ThreadedSpMV(self.indptr, self.indices, unsigned_a.data, (self.number_of_nodes, self.number_of_nodes))
 
-        return self.a
+        return self.unsigned_a_operator
 
     def get_signed_laplacian(self):
         if self.l is None:
-            self.l = lil_matrix((self.number_of_nodes, self.number_of_nodes), dtype='d')
-
-            # add the inverted signs and the degree on the diagonal
-            for node, neighbors in enumerate(self.adjacency_list):
-                for neighbor in neighbors[0]:
-                    self.l[node, neighbor] = -1
-                for neighbor in neighbors[1]:
-                    self.l[node, neighbor] = 1
-                self.l[node, node] = len(neighbors[0]) + len(neighbors[1])
-
-            self.l = self.l.tocsr()
+            # degree on the diagonal and inverted signs elsewhere
+            self.l = (diags(self.get_degrees().astype('d')) - self.get_adjacency_matrix()).tocsr()
 
         return self.l
 
     def get_signed_laplacian_subgraph(self, nodes):
         # order the nodes
-        nodes = list(nodes)
-        nodes.sort()
-
-        # get the ordering in a map
-        ordering = dict(zip(nodes, range(len(nodes))))
-
-        rows, columns, data = [], [], []
-        for node in nodes:
-            order = ordering[node]
-            degree = 0
-            for neighbor in self.adjacency_list[node][0]:
-                if neighbor in ordering:
-                    rows.append(order)
-                    columns.append(ordering[neighbor])
-                    data.append(-1)
-                    degree += 1
-            for neighbor in self.adjacency_list[node][1]:
-                if neighbor in ordering:
-                    rows.append(order)
-                    columns.append(ordering[neighbor])
-                    data.append(1)
-                    degree += 1
-            rows.append(order)
-            columns.append(order)
-            data.append(degree)
-
-        return coo_matrix((data, (rows, columns)), shape=(len(nodes), len(nodes)), dtype='d').tocsr()
+        nodes = np.sort(np.fromiter(nodes, dtype=np.int64))
+
+        # induced adjacency and degrees within the subgraph
+        a = self.get_adjacency_matrix()[nodes][:, nodes]
+        degree = np.asarray(abs(a).sum(axis=1)).ravel()
+
+        return (diags(degree) - a).tocsr()
+
+
+class AdjacencyListView:
+
+    def __init__(self, signed_graph):
+        self.signed_graph = signed_graph
+
+    def __len__(self):
+        return self.signed_graph.number_of_nodes
+
+    def __getitem__(self, node):
+        # slice the row of the node and split it by sign
+        start, end = self.signed_graph.indptr[node], self.signed_graph.indptr[node + 1]
+        neighbors = self.signed_graph.indices[start:end]
+        positive = self.signed_graph.data[start:end] > 0
+        return neighbors[positive].tolist(), neighbors[~positive].tolist()
+
+    def __iter__(self):
+        for node in self.signed_graph.nodes_iterator:
+            yield self[node]
+
+
+def find_dataset_file(dataset_path):
+    # look for the dataset in the usual locations
+    for directory in ('./datasets/', '../../datasets/'):
+        for extension in ('',) + tuple(OPENERS):
+            dataset_file = directory + dataset_path + '.txt' + extension
+            if os.path.exists(dataset_file):
+                return dataset_file
+
+    raise IOError('dataset {} not found (working directory: {})'.format(dataset_path, os.getcwd()))
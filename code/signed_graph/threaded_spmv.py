@@ -0,0 +1,73 @@
+from concurrent.futures import ThreadPoolExecutor
+from scipy.sparse import csr_matrix
+from scipy.sparse.linalg import LinearOperator
+import numpy as np
+
+# number of threads of the sparse products (1: plain scipy products)
+number_of_threads = 1
+executor = None
+
+
+def set_number_of_threads(threads):
+    global number_of_threads, executor
+    threads = max(1, int(threads))
+    if threads != number_of_threads and executor is not None:
+        executor.shutdown()
+        executor = None
+    number_of_threads = threads
+
+
+def get_number_of_threads():
+    return number_of_threads
+
+
+def get_executor():
+    global executor
+    if executor is None:
+        executor = ThreadPoolExecutor(max_workers=number_of_threads)
+    return executor
+
+
+def partition_rows(indptr, parts):
+    # row boundaries of (at most) parts blocks with about the same number of nonzeros each
+    targets = np.linspace(0, indptr[-1], parts + 1)
+    boundaries = np.searchsorted(indptr, targets, side='left')
+    boundaries[0], boundaries[-1] = 0, len(indptr) - 1
+    return np.unique(boundaries)
+
+
+class ThreadedSpMV(LinearOperator):
+    # CSR matrix split into row blocks balanced by nonzeros; the products of the blocks run on a thread pool
+    # (the scipy sparse kernels release the GIL) and write disjoint slices of the output
+
+    def __init__(self, indptr, indices, data, shape, threads=None):
+        super().__init__(dtype=np.dtype('d'), shape=shape)
+        self.threads = threads or get_number_of_threads()
+
+        # the blocks share the indices and data arrays of the matrix (only the row pointers are copied)
+        self.boundaries = partition_rows(indptr, self.threads)
+        self.blocks = []
+        for start, end in zip(self.boundaries[:-1].tolist(), self.boundaries[1:].tolist()):
+            first, last = indptr[start], indptr[end]
+            self.blocks.append(csr_matrix((data[first:last], indices[first:last], indptr[start:end + 1] - first), shape=(end - start, shape[1]), copy=False))
+
+    def product(self, x):
+        y = np.empty((self.shape[0],) + x.shape[1:], dtype=np.result_type(self.dtype, x.dtype))
+
+        def multiply(block, start, end):
+            y[start:end] = block.dot(x)
+
+        if len(self.blocks) == 1:
+            multiply(self.blocks[0], 0, self.shape[0])
+            return y
+
+        futures = [get_executor().submit(multiply, block, start, end) for block, start, end in zip(self.blocks, self.boundaries[:-1], self.boundaries[1:])]
+        for future in futures:
+            future.result()
+        return y
+
+    def _matvec(self, x):
+        return self.product(x)
+
+    def _matmat(self, x):
+        return self.product(x)
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# the modules are imported from the code/ directory, as in main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from signed_graph.signed_graph import SignedGraph
+
+
+@pytest.fixture
+def signed_graph():
+    # random signed graph with 200 nodes and about 1500 edges
+    rng = np.random.default_rng(0)
+    number_of_nodes, number_of_edges = 200, 1500
+    edges = np.column_stack((rng.integers(0, number_of_nodes, number_of_edges), rng.integers(0, number_of_nodes, number_of_edges), rng.choice([-1, 1], number_of_edges)))
+    return SignedGraph(edge_list=edges.tolist(), number_of_nodes=number_of_nodes)
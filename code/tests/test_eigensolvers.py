@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from algorithms.subroutines.eigensolvers import EIGENSOLVER_METHODS, EigenSolver
+
+
+class CountingSolver(EigenSolver):
+    # counts the eigenpairs actually computed
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = 0
+
+    def __call__(self, a, v0=None):
+        self.calls += 1
+        return super().__call__(a, v0)
+
+
+@pytest.mark.parametrize('method', ['lobpcg', 'power', 'randomized'])
+def test_inexact_eigenpair_is_computed_once(signed_graph, method):
+    solver = CountingSolver(method, maxiter=2)
+    first = signed_graph.get_leading_eigenpair(solver)
+    for _ in range(5):
+        assert signed_graph.get_leading_eigenpair(solver)[0] == first[0]
+    assert solver.calls == 1
+
+
+def test_inexact_eigenpair_is_recomputed_for_a_stricter_solver(signed_graph):
+    signed_graph.get_leading_eigenpair(EigenSolver('power', maxiter=1))
+    solver = CountingSolver('arpack', tol=1e-10)
+    signed_graph.get_leading_eigenpair(solver)
+    assert solver.calls == 1
+    assert signed_graph.get_eigenpair_info()["residual"] <= 1e-8
+
+
+@pytest.mark.parametrize('method', EIGENSOLVER_METHODS)
+@pytest.mark.parametrize('time_budget', [0, 1e-5])
+def test_exhausted_time_budget_still_returns_an_eigenpair(signed_graph, method, time_budget):
+    a = signed_graph.get_adjacency_matrix()
+    value, vector, info = EigenSolver(method, time_budget=time_budget)(a)
+    assert np.isfinite(value) and np.all(np.isfinite(vector))
+    assert info["matvecs"] >= 1
+
+
+def test_lobpcg_reports_the_iteration_cap(signed_graph):
+    a = signed_graph.get_adjacency_matrix()
+    _, _, info = EigenSolver('lobpcg', tol=1e-10, maxiter=2)(a)
+    assert info["stopped_by"] == 'maxiter'
+    _, _, info = EigenSolver('lobpcg', tol=1e-6, maxiter=1000)(a)
+    assert info["stopped_by"] == 'convergence'
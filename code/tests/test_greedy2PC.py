@@ -0,0 +1,18 @@
+import numpy as np
+
+from algorithms.greedy2PC import greedy2PC_plus_plus, run_start
+from algorithms.subroutines.commons import evaluate_objective_function, get_top_eigenvectors
+
+
+def test_plus_plus_keeps_the_signs_of_a_non_leading_start(signed_graph):
+    start_x = np.where(get_top_eigenvectors(signed_graph, 3)[:, 2] >= 0, 1, -1)
+    assert np.mean(start_x == np.sign(get_top_eigenvectors(signed_graph, 1)[:, 0])) < 0.9
+
+    _, x, _, _, _, _ = greedy2PC_plus_plus(signed_graph, start_x, 3, print_results=False)
+    support = np.flatnonzero(x)
+    assert len(support) > 0
+    assert np.array_equal(x[support], start_x[support])
+
+    solution_x, polarity, _, _ = run_start(signed_graph, start_x, 3, {})
+    assert np.array_equal(solution_x[np.flatnonzero(solution_x)], start_x[np.flatnonzero(solution_x)])
+    assert np.isclose(polarity, evaluate_objective_function(signed_graph, solution_x))
@@ -1,42 +1,94 @@
+import logging
+import sys
 import numpy as np
 
-from algorithms.subroutines.commons import evaluate_objective_function
+from algorithms.subroutines.commons import evaluate_solutions
+
+# console output levels: nothing, metrics and community sizes, or also the nodes of the communities
+VERBOSITY_LEVELS = ('silent', 'summary', 'full')
+
+# number of node ids formatted and written at a time in the listings
+LISTING_CHUNK_SIZE = 65536
+
+logger = logging.getLogger('polarized_communities')
+
+# current level, and file receiving the node listings at level 'full' (None: the console)
+verbosity = 'summary'
+listing_file = None
+
+
+def set_verbosity(level, listing_path=None):
+    # messages go through the logger to stdout, and are dropped before being formatted when silent
+    global verbosity, listing_file
+    verbosity = level
+    listing_file = listing_path
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel(logging.WARNING if level == 'silent' else logging.INFO)
+
 
 def print_input(dataset, num_nodes, num_edges, algorithm):
-    print('------------- Input -------------')
-    print('dataset:               ' + dataset)
-    print('number of nodes:               ' + str(num_nodes))
-    print('number of edges:               ' + str(num_edges))
-    print('algorithm:             ' + algorithm)
+    logger.info('------------- Input -------------')
+    logger.info('dataset:               %s', dataset)
+    logger.info('number of nodes:               %s', num_nodes)
+    logger.info('number of edges:               %s', num_edges)
+    logger.info('algorithm:             %s', algorithm)
 
 
-def print_end_algorithm(runtime, xs, signed_graph, polarity_scores, beta=np.nan, thresholds=np.nan):
-    print('------------- Output ------------')
+def print_end_algorithm(runtime, xs, signed_graph, polarity_scores, beta=np.nan, thresholds=np.nan, metrics=None):
+    if verbosity == 'silent':
+        return
+
+    logger.info('------------- Output ------------')
 
     # performance information
-    print('runtime:               ' + str(runtime))
+    logger.info('runtime:               %s', runtime)
+
+    logger.info("Total polarity:        %s", sum(polarity_scores))
 
-    print("Total polarity:        " + str(sum(polarity_scores))            )
+    # metrics of all the solutions, in one pass over the graph (unless the caller already evaluated them)
+    if metrics is None:
+        metrics = evaluate_solutions(signed_graph, np.column_stack(xs))
 
     for i, x in enumerate(xs):
 
-        print("----------- solution {} --------------".format(i + 1))
+        logger.info("----------- solution %s --------------", i + 1)
 
-        
         # parameters
-        if not np.isnan(thresholds) and not np.isnan(beta): 
-            print('tau:                   ' + str(thresholds[i] if type(thresholds)==list else np.nan))
-            print('multiplicative factor: ' + str(beta))
+        if type(thresholds) == list:
+            logger.info('tau:                   %s', thresholds[i])
+        if not np.isnan(beta):
+            logger.info('multiplicative factor: %s', beta)
 
         # quality of the solution
-        #assert evaluate_objective_function(signed_graph, x) == polarity_scores[i]
-        print('polarity:              ' + str(evaluate_objective_function(signed_graph, x)))
+        logger.info('polarity:              %s', metrics['polarity'][i])
+        logger.info('agreement ratio:       %s', metrics['agreement_ratio'][i])
+
+        # the nodes of the two communities, streamed in chunks
+        if verbosity == 'full':
+            write_listing(i + 1, x)
+
+        logger.info("|S_1| = %s", metrics['size_S1'][i])
+        logger.info("|S_2| = %s", metrics['size_S2'][i])
+
+
+def write_listing(solution, x):
+    # append the nodes of S_1 and S_2 to the listing file (or write them to the console), one line per community
+    if listing_file is None:
+        stream_listing(sys.stdout, solution, x)
+    else:
+        with open(listing_file, "a") as f:
+            stream_listing(f, solution, x)
+        logger.info('S_1, S_2:              written to %s', listing_file)
 
-        # print the nodes of the two communities
-        community_p1 = {node for node, element in enumerate(x) if element == 1}
-        community_m1 = {node for node, element in enumerate(x) if element == -1}
 
-        print('S_1:                   ' + str(str(community_p1).replace('set([', '').replace('])', '')))
-        print("|S_1| = " + str(len(community_p1)))
-        print('S_2:                   ' + str(str(community_m1).replace('set([', '').replace('])', '')))
-        print("|S_2| = " + str(len(community_m1)))
+def stream_listing(f, solution, x):
+    for name, value in (('S_1', 1), ('S_2', -1)):
+        nodes = np.flatnonzero(x == value)
+        f.write('solution {} {}:'.format(solution, name))
+        for start in range(0, len(nodes), LISTING_CHUNK_SIZE):
+            f.write(' ' + ' '.join(map(str, nodes[start:start + LISTING_CHUNK_SIZE].tolist())))
+        f.write('\n')
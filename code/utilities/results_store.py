@@ -0,0 +1,184 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import numpy as np
+
+# default location of the store, next to the per-dataset output directories
+DEFAULT_STORE = os.path.join("output", "results.sqlite")
+
+# directory of the solution payloads, relative to the output directory
+SOLUTIONS_DIRECTORY = "solutions"
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    dataset TEXT NOT NULL,
+    algorithm TEXT NOT NULL,
+    parameter_hash TEXT NOT NULL,
+    parameters TEXT NOT NULL,
+    graph_hash TEXT,
+    polarity REAL,
+    timestamp TEXT,
+    results TEXT NOT NULL,
+    UNIQUE (dataset, algorithm, parameter_hash)
+);
+CREATE INDEX IF NOT EXISTS results_graph ON results (graph_hash);
+CREATE INDEX IF NOT EXISTS results_polarity ON results (dataset, algorithm, polarity);
+'''
+
+
+def parameter_hash(parameters):
+    # sha1 of the canonical JSON of the parameters (key order does not matter)
+    return hashlib.sha1(json.dumps(parameters, sort_keys=True).encode()).hexdigest()
+
+
+def save_solution(x, output_dir="output"):
+    # store the communities of x (S1: x == 1, S2: x == -1) as two compressed bitmaps in a content-addressed .npz
+    # sidecar, and return the entry that references it from the results
+    membership = ((x == 1).astype(np.int8) - (x == -1).astype(np.int8))
+    checksum = hashlib.sha1(membership.tobytes()).hexdigest()
+    solution_file = os.path.join(SOLUTIONS_DIRECTORY, checksum + '.npz')
+
+    path = os.path.join(output_dir, solution_file)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = '{}.{}.tmp.npz'.format(path[:-len('.npz')], os.getpid())
+        np.savez_compressed(temporary_path, S1=np.packbits(membership == 1), S2=np.packbits(membership == -1))
+        os.replace(temporary_path, path)
+
+    return {"file": solution_file, "number_of_nodes": len(membership), "size_S1": int(np.count_nonzero(membership == 1)),
+            "size_S2": int(np.count_nonzero(membership == -1)), "sha1": checksum}
+
+
+def load_solution(solution, output_dir="output", number_of_nodes=None):
+    # x vector (1 on S1, -1 on S2, 0 elsewhere) of a solution entry of the results, either a reference to a
+    # .npz sidecar or the lists of nodes of older results (which need number_of_nodes)
+    if "file" not in solution:
+        x = np.zeros(number_of_nodes if number_of_nodes is not None else max(solution["S1"] + solution["S2"], default=-1) + 1)
+        x[solution["S1"]] = 1
+        x[solution["S2"]] = -1
+        return x
+
+    number_of_nodes = solution["number_of_nodes"]
+    with np.load(os.path.join(output_dir, solution["file"])) as payload:
+        s1 = np.unpackbits(payload["S1"], count=number_of_nodes).astype(bool)
+        s2 = np.unpackbits(payload["S2"], count=number_of_nodes).astype(bool)
+    membership = s1.astype(np.int8) - s2.astype(np.int8)
+    if hashlib.sha1(membership.tobytes()).hexdigest() != solution["sha1"]:
+        raise ValueError('checksum mismatch for solution {}'.format(solution["file"]))
+    return membership.astype('d')
+
+
+class ResultsStore:
+    # experiment results in SQLite (WAL mode, so that concurrent runs can append safely): one row per
+    # (dataset, algorithm, parameters), replaced when the same parameters are run again
+
+    def __init__(self, path=DEFAULT_STORE):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA busy_timeout=60000')
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def save(self, dataset, algorithm, results, replace=True):
+        # insert the results, or replace the entry with the same parameters (which keeps its position);
+        # with replace=False an existing entry with the same parameters is kept instead
+        parameters = results.get("parameters", {})
+        polarity_scores = [score for score in results.get("polarity_scores", []) if score is not None and score == score]
+        row = (dataset, algorithm, parameter_hash(parameters), json.dumps(parameters, sort_keys=True), results.get("graph_hash"),
+               max(polarity_scores) if polarity_scores else None, results.get("timestamp"), json.dumps(results))
+        on_conflict = '''UPDATE SET
+                    graph_hash = excluded.graph_hash, polarity = excluded.polarity,
+                    timestamp = excluded.timestamp, results = excluded.results''' if replace else 'NOTHING'
+        with self.connection:
+            self.connection.execute('''
+                INSERT INTO results (dataset, algorithm, parameter_hash, parameters, graph_hash, polarity, timestamp, results)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (dataset, algorithm, parameter_hash) DO ''' + on_conflict, row)
+
+    def load(self, dataset, algorithm, parameters=None):
+        # results of a dataset and algorithm in insertion order (only the entry with the given parameters, if any)
+        query = 'SELECT results FROM results WHERE dataset = ? AND algorithm = ?'
+        arguments = [dataset, algorithm]
+        if parameters is not None:
+            query += ' AND parameter_hash = ?'
+            arguments.append(parameter_hash(parameters))
+        return [json.loads(results) for results, in self.connection.execute(query + ' ORDER BY id', arguments)]
+
+    def best_polarity(self, dataset=None):
+        # (dataset, algorithm, best polarity, its parameters) for every algorithm run on the dataset (or on any dataset)
+        query = '''
+            SELECT dataset, algorithm, MAX(polarity), parameters FROM results
+            WHERE polarity IS NOT NULL{} GROUP BY dataset, algorithm ORDER BY dataset, MAX(polarity) DESC'''
+        if dataset is None:
+            rows = self.connection.execute(query.format(''))
+        else:
+            rows = self.connection.execute(query.format(' AND dataset = ?'), (dataset,))
+        return [(dataset, algorithm, polarity, json.loads(parameters)) for dataset, algorithm, polarity, parameters in rows]
+
+    def export_json(self, output_dir="output", dataset=None, algorithm=None):
+        # write output/<dataset>/<algorithm>_results.json in the layout of the former save_results; the entries of
+        # an existing file that are missing from the store are imported first, so that rewriting the file keeps them
+        query = 'SELECT DISTINCT dataset, algorithm FROM results'
+        pairs = [(d, a) for d, a in self.connection.execute(query) if dataset in (None, d) and algorithm in (None, a)]
+        for d, a in pairs:
+            output_file = os.path.join(output_dir, d, f"{a}_results.json")
+            if os.path.exists(output_file):
+                self.import_json_file(output_file, d, a, replace=False)
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+            with open(output_file + '.tmp', "w") as f:
+                json.dump(self.load(d, a), f, indent=2, separators=(',', ': '))
+            os.replace(output_file + '.tmp', output_file)
+        return len(pairs)
+
+    def import_json(self, output_dir="output"):
+        # load the entries of existing output/<dataset>/<algorithm>_results.json files
+        count = 0
+        for output_file in sorted(glob.glob(os.path.join(output_dir, '*', '*_results.json'))):
+            dataset = os.path.basename(os.path.dirname(output_file))
+            algorithm = os.path.basename(output_file)[:-len('_results.json')]
+            count += self.import_json_file(output_file, dataset, algorithm)
+        return count
+
+    def import_json_file(self, output_file, dataset, algorithm, replace=True):
+        # load the entries of one JSON file (replace=False keeps the entries already in the store)
+        count = 0
+        with open(output_file, "r") as f:
+            for results in json.load(f):
+                if isinstance(results, dict):
+                    self.save(dataset, algorithm, results, replace=replace)
+                    count += 1
+        return count
+
+
+if __name__ == '__main__':
+    # python -m utilities.results_store {export, import, best} (from the code/ directory)
+    parser = argparse.ArgumentParser(description='Manage the results store')
+    parser.add_argument('command', choices=('export', 'import', 'best'))
+    parser.add_argument('-d', '--dataset', help='restrict to a dataset', type=str, default=None)
+    parser.add_argument('-a', '--algorithm', help='restrict to an algorithm (export)', type=str, default=None)
+    parser.add_argument('--store', help='path of the store', type=str, default=DEFAULT_STORE)
+    parser.add_argument('--output', help='directory of the JSON files', type=str, default="output")
+    args = parser.parse_args()
+
+    with ResultsStore(args.store) as store:
+        if args.command == 'export':
+            print('{} files exported'.format(store.export_json(args.output, args.dataset, args.algorithm)))
+        elif args.command == 'import':
+            print('{} entries imported'.format(store.import_json(args.output)))
+        else:
+            for dataset, algorithm, polarity, parameters in store.best_polarity(args.dataset):
+                print('{:<20} {:<20} {:<20} {}'.format(dataset, algorithm, polarity, json.dumps(parameters)))
@@ -0,0 +1,100 @@
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from utilities.results_store import DEFAULT_STORE, parameter_hash
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS run_cache (
+    graph_hash TEXT NOT NULL,
+    algorithm TEXT NOT NULL,
+    parameter_hash TEXT NOT NULL,
+    code_version TEXT NOT NULL,
+    results TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (graph_hash, algorithm, parameter_hash, code_version)
+);
+CREATE INDEX IF NOT EXISTS run_cache_last_used ON run_cache (last_used);
+'''
+
+# code version of this checkout, computed once per process
+code_version_hash = None
+
+
+def code_version():
+    # sha1 of the sources of the code/ directory: any change to an algorithm invalidates its cached runs
+    global code_version_hash
+    if code_version_hash is None:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        digest = hashlib.sha1()
+        for source in sorted(glob.glob(os.path.join(root, '**', '*.py'), recursive=True)):
+            digest.update(os.path.relpath(source, root).encode())
+            with open(source, "rb") as f:
+                digest.update(f.read())
+        code_version_hash = digest.hexdigest()
+
+    return code_version_hash
+
+
+class RunCache:
+    # results of earlier runs keyed by (graph content hash, algorithm, parameters, code version), in a table of the
+    # results store; entries unused for max_age seconds, and the least recently used beyond max_entries, are evicted
+
+    def __init__(self, path=DEFAULT_STORE, max_age=None, max_entries=None):
+        self.max_age = max_age
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA busy_timeout=60000')
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+        self.evict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def get(self, graph_hash, algorithm, parameters):
+        # results of the same run, or None
+        key = (graph_hash, algorithm, parameter_hash(parameters), code_version())
+        row = self.connection.execute('''
+            SELECT results, last_used FROM run_cache
+            WHERE graph_hash = ? AND algorithm = ? AND parameter_hash = ? AND code_version = ?''', key).fetchone()
+        if row is None or (self.max_age is not None and time.time() - row[1] > self.max_age):
+            return None
+
+        with self.connection:
+            self.connection.execute('''
+                UPDATE run_cache SET last_used = ?
+                WHERE graph_hash = ? AND algorithm = ? AND parameter_hash = ? AND code_version = ?''', (time.time(),) + key)
+        return json.loads(row[0])
+
+    def put(self, graph_hash, algorithm, parameters, results):
+        now = time.time()
+        with self.connection:
+            self.connection.execute('''
+                INSERT OR REPLACE INTO run_cache (graph_hash, algorithm, parameter_hash, code_version, results, created, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?)''', (graph_hash, algorithm, parameter_hash(parameters), code_version(), json.dumps(results), now, now))
+        self.evict()
+
+    def evict(self):
+        # drop the expired entries, then the least recently used ones over the size limit; returns the number dropped
+        with self.connection:
+            evicted = 0
+            if self.max_age is not None:
+                evicted += self.connection.execute('DELETE FROM run_cache WHERE last_used < ?', (time.time() - self.max_age,)).rowcount
+            if self.max_entries is not None:
+                evicted += self.connection.execute('''
+                    DELETE FROM run_cache WHERE rowid NOT IN (
+                        SELECT rowid FROM run_cache ORDER BY last_used DESC LIMIT ?)''', (self.max_entries,)).rowcount
+        return evicted